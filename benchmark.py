@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+
+"""benchmark.
+
+Usage:
+    benchmark scope_index [--sizes <sizes>] [-o <results> | --output <results>]
+    benchmark walker [--depth <depth>] [--fanout <fanout>]
+                     [--workers <workers>] [--latency <latency>]
+                     [-o <results> | --output <results>]
+    benchmark memory [--sizes <sizes>] [-o <results> | --output <results>]
+    benchmark yaml [--entries <entries>] [-o <results> | --output <results>]
+    benchmark data_model [--sizes <sizes>] [-o <results> | --output <results>]
+    benchmark evaluator [--sizes <sizes>] [-o <results> | --output <results>]
+    benchmark pipeline [--nodes <nodes>] [-o <results> | --output <results>]
+    benchmark executor [--tasks <tasks>] [--workers <workers>]
+                       [-o <results> | --output <results>]
+    benchmark suite [-o <results> | --output <results>]
+    benchmark compare <baseline> <results> [--threshold <percent>]
+    benchmark -h | --help
+
+Options:
+    --sizes <sizes>
+        Comma separated numbers of files to benchmark against.
+        [default: 10000,100000,1000000]
+    --depth <depth>
+        Depth of the synthetic directory tree. [default: 5]
+    --fanout <fanout>
+        Number of subdirectories (and of files) per directory. [default: 6]
+    --workers <workers>
+        Comma separated numbers of walking threads. [default: 1,4,16]
+    --latency <latency>
+        Milliseconds added to each directory scan, to mimic the metadata
+        round trip of a networked file system. [default: 0]
+    --entries <entries>
+        Number of scope values in the benchmarked status file.
+        [default: 100000]
+    --nodes <nodes>
+        Comma separated numbers of nodes of the synthetic pipelines.
+        [default: 10,100,1000]
+    --tasks <tasks>
+        Number of no-op commands launched by each executor. [default: 1000]
+    -o --output <results>
+        Also save the results in this json file, to be compared with the
+        ones of another commit.
+    --threshold <percent>
+        A time or a memory size of <results> more than <percent> above the
+        one of <baseline> is a regression, the exit status is then 1.
+        [default: 10]
+    -h --help
+        Show this screen.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import datetime
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from docopt import docopt
+
+# Scope expressions mimicking the ones of tests_data/pipes/test_pipeline.yaml
+SCOPE_EXPRESSIONS = {'__ROOT__': '/bench/',
+                     'SCOPE_1': '^.*scope_1.*?/',
+                     'SCOPE_2': '^.*scope_2_[0-9a-z]+/',
+                     'SCOPE_3': '^.*scope_3-\\w+',
+                     'SCOPE_4': '^.*scope_4.*?$'}
+
+
+def synthetic_files(nb_files, root='/bench'):
+    """
+    Sorted list of 'nb_files' paths nested like tests_data/functional_tests:
+    root/scope_1_X/scope_2_Y/scope_3-Z_scope_4_W
+    """
+    files = []
+    i = 0
+    while len(files) < nb_files:
+        files.append("{0}/scope_1_{1}/scope_2_{2}/scope_3-{3}_scope_4_{4}"
+                     "".format(root, i // 10000, (i // 100) % 100,
+                               (i // 10) % 10, i % 10))
+        i += 1
+    return sorted(files)
+
+
+def synthetic_tree(root, depth, fanout):
+    """
+    Create on disk a tree of directories 'depth' levels deep, each directory
+    having 'fanout' subdirectories and 'fanout' empty files.
+    Return the number of files created.
+    """
+    nb_files = 0
+    for i in range(fanout):
+        open(os.path.join(root, "file_{}".format(i)), 'w').close()
+        nb_files += 1
+    if depth > 0:
+        for i in range(fanout):
+            subdir = os.path.join(root, "scope_{0}_{1}".format(depth, i))
+            os.mkdir(subdir)
+            nb_files += synthetic_tree(subdir, depth - 1, fanout)
+    return nb_files
+
+
+def timed(function, *args, **kwargs):
+    """
+    Return the wall time in seconds taken by a call to function.
+    """
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def bench_scope_index(sizes):
+    """
+    Time the construction of a ScopeIndex for each size of file list.
+    The time per file has to stay roughly constant: scaling is linear.
+    """
+    from scope_index import ScopeIndex
+    from data_model import escape_reserved_re_char
+    results = []
+    for size in sizes:
+        files = synthetic_files(size)
+        elapsed = timed(ScopeIndex(SCOPE_EXPRESSIONS).build, files,
+                        escape=escape_reserved_re_char)
+        results.append({'files': size,
+                        'seconds': elapsed,
+                        'us_per_file': elapsed / size * 1e6})
+    return results
+
+
+def bench_walker(depth, fanout, workers, latency=0):
+    """
+    Time a cold walk (no snapshot) of a synthetic deep tree with path.py's
+    walkfiles and with FileListing for each number of workers.
+    'latency' (in seconds) is added to each directory scan of FileListing.
+    """
+    import path
+    import file_listing
+    from file_listing import FileListing
+    if latency:
+        scan_directory = file_listing.scan_directory
+
+        def slow_scan_directory(dirname):
+            time.sleep(latency)
+            return scan_directory(dirname)
+        file_listing.scan_directory = slow_scan_directory
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        nb_files = synthetic_tree(root, depth, fanout)
+        expected = sorted(path.Path(root).walkfiles())
+        results.append({'walker': 'walkfiles', 'files': nb_files,
+                        'seconds': timed(sorted,
+                                         path.Path(root).walkfiles())})
+        for nb_workers in workers:
+            listing = FileListing(root, workers=nb_workers)
+            start = time.perf_counter()
+            files = listing.walk()
+            elapsed = time.perf_counter() - start
+            assert files == expected
+            results.append({'walker': 'FileListing', 'workers': nb_workers,
+                            'files': nb_files, 'seconds': elapsed})
+    return results
+
+
+def allocated(function, *args, **kwargs):
+    """
+    Return the result of a call to function and the number of bytes
+    allocated by this call still in use after it.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function(*args, **kwargs)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def bench_memory(sizes):
+    """
+    Memory used by the files of a synthetic deep root, as a list of
+    path.Path (what DataModel.files used to be) and as a FileTable.
+    """
+    import path
+    from file_table import FileTable
+    results = []
+    for size in sizes:
+        files = synthetic_files(size, root='/data/projects/cohort/raw/bench')
+        paths, paths_bytes = allocated(lambda: [path.Path(f) for f in files])
+        del paths
+        table, table_bytes = allocated(FileTable, files)
+        del table
+        results.append({'files': size,
+                        'path_list_MB': paths_bytes / 2**20,
+                        'file_table_MB': table_bytes / 2**20,
+                        'ratio': paths_bytes / table_bytes})
+    return results
+
+
+def synthetic_statuses(nb_entries):
+    """
+    Statuses of 'nb_entries' scope values, like in a .nexec file.
+    """
+    from collections import OrderedDict
+    from yaml_io import Literal
+    statuses = dict()
+    for i, f in enumerate(synthetic_files(nb_entries)):
+        status = OrderedDict()
+        status["execution_date"] = datetime.datetime(2016, 1, 1, 0, 0, i % 60)
+        status["duration"] = 0.123
+        status["status"] = "SUCCESS"
+        status["context"] = "EXECUTED"
+        status["cmd"] = "process --input " + f
+        status["log"] = "/bench/.presto/logs/node/" + str(i) + ".log"
+        status["output_size"] = 42
+        status["message"] = Literal("processing " + f + "\ndone\n")
+        statuses[f] = status
+    return statuses
+
+
+def bench_yaml(nb_entries):
+    """
+    Time the dump and the load of a status file with the pure python
+    PyYAML and with libyaml (if PyYAML has been built with it).
+    """
+    import yaml
+    import yaml_io
+    statuses = synthetic_statuses(nb_entries)
+    implementations = [('python', yaml.SafeLoader, yaml.SafeDumper)]
+    if yaml.__with_libyaml__:
+        implementations.append(('libyaml', yaml.CSafeLoader,
+                                yaml.CSafeDumper))
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "node.nexec")
+        for name, loader, dumper in implementations:
+            yaml.add_representer(yaml_io.Literal, yaml_io.literal_presenter,
+                                 Dumper=dumper)
+            yaml.add_representer(yaml_io.OrderedDict,
+                                 yaml_io.ordered_dict_presenter,
+                                 Dumper=dumper)
+
+            def dump():
+                with open(filename, 'w') as stream:
+                    yaml.dump(statuses, stream, Dumper=dumper,
+                              default_flow_style=False, allow_unicode=True)
+
+            def load():
+                with open(filename, 'r') as stream:
+                    return yaml.load(stream, Loader=loader)
+            dump_seconds = timed(dump)
+            load_seconds = timed(load)
+            assert len(load()) == nb_entries
+            results.append({'yaml': name, 'entries': nb_entries,
+                            'MB': os.path.getsize(filename) / 2**20,
+                            'dump_seconds': dump_seconds,
+                            'load_seconds': load_seconds})
+    return results
+
+
+def synthetic_data_model(nb_files):
+    """
+    Set up DataModel with 'nb_files' synthetic files (see synthetic_files)
+    and the scopes of SCOPE_EXPRESSIONS, without walking any directory.
+    """
+    import path
+    from data_model import DataModel
+    from evaluator import Evaluator
+    from file_table import FileTable
+    helpers = dict(SCOPE_EXPRESSIONS)
+    helpers['__ROOT__'] = '/bench'
+    Evaluator.set_helpers(helpers)
+    DataModel.root = path.Path('/bench')
+    DataModel.document_path = path.Path('/bench')
+    DataModel.files = FileTable(synthetic_files(nb_files))
+    DataModel.scopes = dict()
+    DataModel._make_scopes(SCOPE_EXPRESSIONS)
+
+
+def bench_data_model(sizes):
+    """
+    Time the construction of the data model (the scopes, their index and
+    their tree) from a listing of __ROOT__ of each size. The listing itself
+    is benchmarked by 'benchmark walker'.
+    """
+    from data_model import DataModel
+    results = []
+    for size in sizes:
+        elapsed = timed(synthetic_data_model, size)
+        results.append({'files': size,
+                        'scope_values': sum(len(s.values) for s in
+                                            DataModel.scopes.values()),
+                        'seconds': elapsed,
+                        'us_per_file': elapsed / size * 1e6})
+    return results
+
+
+def bench_evaluator(sizes):
+    """
+    Time the evaluation of a dynamic expression for every value of the
+    deepest scope, through Evaluator.evaluate (with an empty cache) and
+    through Evaluator._evaluate_dynamic.
+    """
+    from data_model import DataModel
+    from evaluator import Evaluator
+    string = "?{SCOPE_3}/out"
+    results = []
+    for size in sizes:
+        synthetic_data_model(size)
+        values = DataModel.scopes['SCOPE_4'].values
+        Evaluator.clear_cache()
+        evaluate = timed(lambda: [Evaluator(v).evaluate(string)
+                                  for v in values])
+        dynamic = timed(lambda: [Evaluator(v)._evaluate_dynamic(string,
+                                                                "SCOPE_3")
+                                 for v in values])
+        results.append({'files': size,
+                        'evaluations': len(values),
+                        'us_per_evaluate': evaluate / len(values) * 1e6,
+                        'us_per_evaluate_dynamic':
+                        dynamic / len(values) * 1e6})
+    return results
+
+
+def synthetic_pipeline(nb_nodes, seed=0):
+    """
+    Documents of a pipeline of 'nb_nodes' nodes, each one depending on up
+    to three of the previous ones, with a dynamic expression in their
+    command.
+    """
+    rng = random.Random(seed)
+    scopes = ['SCOPE_1', 'SCOPE_2', 'SCOPE_3']
+    documents = []
+    for i in range(nb_nodes):
+        parents = ["node_{}".format(p) for p in
+                   sorted(set(rng.randrange(i) for _ in range(3)))] if i \
+            else []
+        documents.append({'__NAME__': "node_{}".format(i),
+                          '__DESCRIPTION__': "synthetic node {}".format(i),
+                          '__SCOPE__': scopes[i % len(scopes)],
+                          '__CMD__': ["process", "?{SCOPE_1}",
+                                      "${__ROOT__}/out_" + str(i)],
+                          '__DEPEND_ON__': parents})
+    return documents
+
+
+def bench_pipeline(nodes, nb_files=1000):
+    """
+    Time the construction of synthetic pipelines (of which building the
+    nodes, evaluating their commands for each scope value) and of its
+    Pipeline._thin, on a data model of 'nb_files' files.
+    """
+    import networkx as nx
+    from pipeline import Pipeline
+    synthetic_data_model(nb_files)
+    results = []
+    for nb_nodes in nodes:
+        documents = synthetic_pipeline(nb_nodes)
+        # The graph is an attribute of the class, start from an empty one.
+        Pipeline._graph = nx.DiGraph()
+        start = time.perf_counter()
+        pipe = Pipeline(documents)
+        elapsed = time.perf_counter() - start
+        # Put back the edges removed by the construction.
+        pipe._build_edges()
+        edges = pipe._graph.number_of_edges()
+        thin = timed(pipe._thin)
+        results.append({'nodes': nb_nodes, 'edges': edges,
+                        'seconds': elapsed, 'thin_seconds': thin})
+    Pipeline._graph = nx.DiGraph()
+    return results
+
+
+def bench_executor(nb_tasks, workers):
+    """
+    Time each executor launching 'nb_tasks' no-op commands (one node of
+    'nb_tasks' scope values): the time per task is the overhead of
+    presto around a command.
+    """
+    import io
+    import path
+    import contextlib
+    import networkx as nx
+    import settings
+    import executor
+    from pipeline import Pipeline
+    from fingerprint import Fingerprinter
+    executors = [('threaded', executor.ThreadedPipelineExecutor),
+                 ('async', executor.AsyncPipelineExecutor),
+                 ('dag', executor.DagPipelineExecutor)]
+    synthetic_data_model(nb_tasks)
+    documents = [{'__NAME__': "noop", '__DESCRIPTION__': "no-op",
+                  '__SCOPE__': 'SCOPE_4', '__CMD__': ["true"],
+                  '__DEPEND_ON__': []}]
+    Pipeline._graph = nx.DiGraph()
+    pipe = Pipeline(documents)
+    nb_tasks = len(pipe.nodes["noop"].scope.values)
+    results = []
+    presto_dir = settings.PRESTO_DIR
+    try:
+        for nb_workers in workers:
+            for name, executor_class in executors:
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    settings.PRESTO_DIR = path.Path(tmpdir)
+                    ex = executor_class(pipe, nb_workers)
+                    ex.fingerprinter = Fingerprinter('none')
+                    # progression bars aren't part of the benchmark output.
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        elapsed = timed(ex.execute)
+                results.append({'executor': name, 'workers': nb_workers,
+                                'tasks': nb_tasks, 'seconds': elapsed,
+                                'us_per_task': elapsed / nb_tasks * 1e6})
+    finally:
+        settings.PRESTO_DIR = presto_dir
+        Pipeline._graph = nx.DiGraph()
+    return results
+
+
+def run_suite():
+    """
+    Run all the benchmarks with sizes small enough to be run on each
+    commit, as a dictionary {title: results}.
+    """
+    return {"ScopeIndex.build": bench_scope_index([10000, 100000]),
+            "DataModel construction": bench_data_model([10000, 100000]),
+            "Evaluator": bench_evaluator([10000]),
+            "Pipeline construction": bench_pipeline([10, 100, 1000]),
+            "Executor overhead": bench_executor(1000, [1, 4]),
+            "Walk of __ROOT__": bench_walker(4, 6, [1, 4]),
+            "Memory of DataModel.files": bench_memory([100000]),
+            "Status file dump and load": bench_yaml(10000)}
+
+
+# Result fields which are measurements, a greater value is worse: the
+# others are the parameters of the benchmark.
+MEASUREMENT = re.compile(r'seconds$|^us_per_|_MB$|^MB$')
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(filename, results):
+    """
+    Save {title: results} with the commit and the host they come from.
+    """
+    with open(filename, 'w') as stream:
+        json.dump({'commit': current_commit(),
+                   'date': datetime.datetime.now().isoformat(),
+                   'python': platform.python_version(),
+                   'machine': platform.node(),
+                   'results': results}, stream, indent=2)
+
+
+def compare_results(baseline, results, threshold):
+    """
+    List of the regressions from the results of the 'baseline' to the
+    'results' (both loaded from save_results's files): (title, parameters,
+    measurement, baseline value, value) for each measurement more than
+    'threshold' percent above the baseline's.
+    Results are matched by title and by parameters.
+    """
+    regressions = []
+    for title, rows in results['results'].items():
+        previous = dict()
+        for row in baseline['results'].get(title, []):
+            previous[parameters_of(row)] = row
+        for row in rows:
+            parameters = parameters_of(row)
+            if parameters not in previous:
+                continue
+            for key, value in row.items():
+                if not MEASUREMENT.search(key):
+                    continue
+                before = previous[parameters].get(key)
+                if before and value > before * (1 + threshold / 100):
+                    regressions.append((title, parameters, key, before,
+                                        value))
+    return regressions
+
+
+def parameters_of(row):
+    return tuple(sorted((k, v) for k, v in row.items()
+                        if not MEASUREMENT.search(k) and
+                        not isinstance(v, float)))
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return "{:.6g}".format(value)
+    return value
+
+
+def print_results(title, results):
+    print(title)
+    for r in results:
+        print("  " + ", ".join("{0}: {1}".format(k, format_value(v))
+                               for k, v in r.items()))
+
+
+def compare(arguments):
+    with open(arguments['<baseline>']) as stream:
+        baseline = json.load(stream)
+    with open(arguments['<results>']) as stream:
+        results = json.load(stream)
+    threshold = float(arguments['--threshold'])
+    print("Comparing {0} to {1}".format(results.get('commit'),
+                                        baseline.get('commit')))
+    regressions = compare_results(baseline, results, threshold)
+    for title, parameters, key, before, value in regressions:
+        print("  {0} ({1}) {2}: {3} -> {4} (+{5:.0f}%)".format(
+            title, ", ".join("{0}: {1}".format(k, v) for k, v in parameters),
+            key, format_value(before), format_value(value),
+            (value / before - 1) * 100))
+    if regressions:
+        print("{} regression(s) above {}%".format(len(regressions),
+                                                   threshold))
+        return 1
+    print("No regression above {}%".format(threshold))
+    return 0
+
+
+def main(arguments):
+    if arguments['compare']:
+        return compare(arguments)
+    sizes = [int(s) for s in arguments['--sizes'].split(',')]
+    workers = [int(w) for w in arguments['--workers'].split(',')]
+    if arguments['suite']:
+        results = run_suite()
+    elif arguments['scope_index']:
+        results = {"ScopeIndex.build": bench_scope_index(sizes)}
+    elif arguments['memory']:
+        results = {"Memory of DataModel.files": bench_memory(sizes)}
+    elif arguments['yaml']:
+        results = {"Status file dump and load":
+                   bench_yaml(int(arguments['--entries']))}
+    elif arguments['walker']:
+        results = {"Walk of __ROOT__":
+                   bench_walker(int(arguments['--depth']),
+                                int(arguments['--fanout']), workers,
+                                float(arguments['--latency']) / 1000)}
+    elif arguments['data_model']:
+        results = {"DataModel construction": bench_data_model(sizes)}
+    elif arguments['evaluator']:
+        results = {"Evaluator": bench_evaluator(sizes)}
+    elif arguments['pipeline']:
+        nodes = [int(n) for n in arguments['--nodes'].split(',')]
+        results = {"Pipeline construction": bench_pipeline(nodes)}
+    elif arguments['executor']:
+        results = {"Executor overhead":
+                   bench_executor(int(arguments['--tasks']), workers)}
+    for title, rows in results.items():
+        print_results(title, rows)
+    if arguments['--output']:
+        save_results(arguments['--output'], results)
+    return 0
+
+
+# -- Main
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    sys.exit(main(arguments))
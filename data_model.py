@@ -2,6 +2,11 @@ import re
 import logging
 from pprint import pformat
 from scope import Scope
+from scope_index import ScopeIndex
+from scope_tree import ScopeTree
+from file_listing import FileListing
+from walk_filter import WalkFilter
+from profiling import Profiling
 import settings
 
 try:
@@ -18,19 +23,42 @@ TO_ESCAPE_FOR_RE = r"()[]{}*+?|.^$\\"
 TO_ESCAPE_INSIDE_BRACKET_FOR_RE = r"\^\-\]\\"
 
 
-def escape_reserved_re_char(string):
+def _reserved_re_char_class():
     """
-    Escape with a backslash characters reserved by regular expressions
-    in the given string.
+    Content of a [] class matching all chars of TO_ESCAPE_FOR_RE.
     """
     # first escape all char that have to be escaped inside []
     # (we're actually putting them inside [])
-    to_escape = re.sub("(?P<char>[" + TO_ESCAPE_INSIDE_BRACKET_FOR_RE + "])",
-                       r"\\\g<char>",
-                       TO_ESCAPE_FOR_RE)
-    return re.sub("(?P<char>[" + to_escape + "])",
+    return re.sub("(?P<char>[" + TO_ESCAPE_INSIDE_BRACKET_FOR_RE + "])",
                   r"\\\g<char>",
-                  string)
+                  TO_ESCAPE_FOR_RE)
+
+
+_RESERVED_RE_CHAR = re.compile("(?P<char>[" + _reserved_re_char_class() +
+                               "])")
+_ESCAPED_LITERAL = re.compile(r"(?:[^" + _reserved_re_char_class() +
+                              r"]|\\[" + _reserved_re_char_class() +
+                              r"])*")
+_ESCAPED_RE_CHAR = re.compile(r"\\(?P<char>.)", re.DOTALL)
+
+
+def escape_reserved_re_char(string):
+    """
+    Escape with a backslash characters reserved by regular expressions
+    in the given string.
+    """
+    return _RESERVED_RE_CHAR.sub(r"\\\g<char>", string)
+
+
+def unescape_reserved_re_char(string):
+    """
+    Reverse escape_reserved_re_char: return the literal string a regular
+    expression only made of plain or escaped characters matches.
+    Return None if 'string' isn't such a regular expression.
+    """
+    if _ESCAPED_LITERAL.fullmatch(string) is None:
+        return None
+    return _ESCAPED_RE_CHAR.sub(r"\g<char>", string)
 
 
 class MetaDataModel(type):
@@ -65,6 +93,22 @@ class MetaDataModel(type):
     def scopes(self, value):
         self._scopes = value
 
+    @property
+    def scope_index(cls):
+        return cls._scope_index
+
+    @scope_index.setter
+    def scope_index(self, value):
+        self._scope_index = value
+
+    @property
+    def scope_tree(cls):
+        return cls._scope_tree
+
+    @scope_tree.setter
+    def scope_tree(self, value):
+        self._scope_tree = value
+
     @property
     def document_path(self):
         return self._document_path
@@ -81,6 +125,8 @@ class DataModel(metaclass=MetaDataModel):
     _files = None
     _root = None
     _scopes = None
+    _scope_index = None
+    _scope_tree = None
     _document_path = None
 
     def __init__(self, yaml_doc, yaml_doc_dir, scope_to_override):
@@ -99,7 +145,10 @@ class DataModel(metaclass=MetaDataModel):
         yaml_doc.update(scope_to_override)
         Evaluator.set_helpers(yaml_doc)
         try:
-            DataModel._set_root(yaml_doc['__ROOT__'])
+            with Profiling.phase("root walk"):
+                DataModel._set_root(yaml_doc['__ROOT__'],
+                                    yaml_doc.get('__SCOPES__'),
+                                    scope_to_override)
         except KeyError:
             logging.error("configuration file must have a '__ROOT__' "
                           "attribute.")
@@ -121,7 +170,8 @@ class DataModel(metaclass=MetaDataModel):
                     raise
 
             scope_dict.update(scope_to_override)
-            DataModel._make_scopes(scope_dict)
+            with Profiling.phase("scopes"):
+                DataModel._make_scopes(scope_dict)
             logging.debug("Scopes:\n%s", pformat(DataModel.scopes))
         except KeyError:
             logging.error("configuration file must have a '__SCOPES__' "
@@ -131,38 +181,111 @@ class DataModel(metaclass=MetaDataModel):
             raise DataModelError()
 
     @classmethod
-    def _set_root(cls, root):
+    def files_matching(cls, scope_value):
+        """
+        List of the files in which the scope value (a regular expression)
+        can be found. Known scope values are looked up in the scope index,
+        escaped literal paths are looked up with bisect in the sorted files,
+        others are searched in all the files.
+        """
+        if cls.scope_index is not None:
+            files = cls.scope_index.files_of(scope_value)
+            if files is not None:
+                return files
+            literal = cls.literal_of(scope_value)
+            # Only an absolute path can't be found elsewhere than at the
+            # beginning of a file path.
+            if literal is not None and literal.startswith(cls.root):
+                return cls.scope_index.files_with_prefix(literal)
+        return [f for f in cls.files if re.search(scope_value, f)]
+
+    @classmethod
+    def literal_of(cls, scope_value):
+        """
+        The literal string matched by a scope value,
+        None if the scope value isn't an escaped literal.
+        """
+        if cls.scope_index is not None:
+            literal = cls.scope_index.literal_of(scope_value)
+            if literal is not None:
+                return literal
+        return unescape_reserved_re_char(scope_value)
+
+    @classmethod
+    def _set_root(cls, root, scope_dict=None, scope_to_override=None):
         from evaluator import Evaluator
         evltr = Evaluator()
         root = evltr.evaluate(root)
         cls.root = path.Path(root).abspath()
         try:
-            cls.files = sorted(cls.root.walkfiles())
-            logging.debug("files:\n%s", pformat(cls.files))
+            # The listing is cached under PRESTO_DIR when there is one.
+            listing = FileListing(cls.root, settings.PRESTO_DIR or None,
+                                  settings.WALK_WORKERS,
+                                  cls._make_walk_filter(scope_dict,
+                                                        scope_to_override))
+            cls.files = listing.walk(settings.USE_FILE_SNAPSHOT)
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("files:\n%s", pformat(list(cls.files)))
         except OSError:
             logging.error("no such directory: ('%s')", cls.root)
             raise
 
+    @classmethod
+    def _make_walk_filter(cls, scope_dict, scope_to_override):
+        """
+        Build the WalkFilter skipping the directories of root which can't
+        hold any file matched by the scopes.
+        With settings.PRUNE_WALK only the overridden scopes (or all the
+        scopes but __ROOT__ if none is overridden) are considered: the
+        files of the other directories are then missing from DataModel.files
+        and from the values of __ROOT__ too.
+        Return None if nothing can be pruned.
+        """
+        from evaluator import Evaluator
+        if not scope_dict:
+            return None
+        peers = dict(scope_dict)
+        peers.update(scope_to_override or dict())
+        if settings.PRUNE_WALK:
+            if scope_to_override:
+                peers = {k: peers[k] for k in scope_to_override}
+            else:
+                peers.pop('__ROOT__', None)
+        evltr = Evaluator()
+        expressions = []
+        for key in peers:
+            try:
+                expressions.append(evltr.evaluate(peers[key]))
+            except (TypeError, KeyError):
+                # A dynamic ?{} expression needs the files to be evaluated,
+                # (errors are reported when making scopes).
+                return None
+        walk_filter = WalkFilter(cls.root, expressions,
+                                 relative=settings.PRUNE_WALK)
+        if not walk_filter.prunes:
+            return None
+        return walk_filter
+
     @classmethod
     def _make_scopes(cls, peers):
+        """
+        Evaluate all the scope expressions, then let a ScopeIndex find the
+        values of every scope in a single walk over the files.
+        """
         from evaluator import Evaluator
         evltr = Evaluator()
+        expressions = dict()
         for key in peers:
-            name = key
             try:
-                expression = evltr.evaluate(peers[key])
+                expressions[key] = evltr.evaluate(peers[key])
             except (TypeError, KeyError):
                 logging.critical("Error in __SCOPES__ definition for {0}"
                                  "".format(key))
                 raise
-            values = set()
-            for f in cls.files:
-                try:
-                    match = re.search(r".*?" + expression, f)
-                except re.error:
-                    logging.critical("bad regular expression '%s' for %s: ",
-                                     key, expression)
-                    raise
-                if(match):
-                    values.add(escape_reserved_re_char(match.group(0)))
-            cls.scopes[name] = Scope(name, expression, sorted(values))
+        cls.scope_index = ScopeIndex(expressions).build(
+            cls.files, escape=escape_reserved_re_char)
+        for name, expression in expressions.items():
+            values = cls.scope_index.values(name)
+            literals = [cls.scope_index.literal_of(v) for v in values]
+            cls.scopes[name] = Scope(name, expression, values, literals)
+        cls.scope_tree = ScopeTree(cls.scope_index)
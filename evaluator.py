@@ -1,10 +1,18 @@
 import logging
 import re
+import functools
 
 from pprint import pformat
+from template import Template
 import settings
 
 
+# Number of compiled templates and of (template, scope value) evaluations
+# kept in memory.
+TEMPLATE_CACHE_SIZE = 4096
+EVALUATION_CACHE_SIZE = 2**16
+
+
 class Evaluator():
     _helpers = None
     _cur_scope_value = None
@@ -12,6 +20,16 @@ class Evaluator():
     @classmethod
     def set_helpers(cls, helpers):
         cls._helpers = helpers
+        cls.clear_cache()
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Forget compiled templates and memoized evaluations, to be called
+        each time helpers or the data model change.
+        """
+        cls._compile.cache_clear()
+        cls._evaluate_cached.cache_clear()
 
     def __init__(self, cur_scope_value=None):
         if (self._helpers is None):
@@ -22,48 +40,59 @@ class Evaluator():
 
     def evaluate(self, string):
         """
-        Try to evaluate staticly or dynamicly the given yaml string
-        while a static ${key} or a dynamic ?{key} has been found inside.
+        Evaluate staticly or dynamicly the given yaml string
+        i.e. substitute every static ${key} and every dynamic ?{key}
+        found inside.
 
         'current_expr' is needed by 'evaluate_dynamic_expression()'
         to know in which files inside which scope seeking for a match
         with the regular expression associated to the dynamic ?{key}
+
+        The string is compiled once in a Template and the result is
+        memoized for each scope value.
         """
-        all_evaluated = False
-        while(not all_evaluated):
-            try:
-                match_dolls = re.search(r"\$\{(.*?)\}", string)
-                match_quest = re.search(r"\?\{(.*?)\}", string)
-            except TypeError:
-                msg = ("Expression to evaluate is not of type String: " +
-                       settings.FAIL + "{}".format(string) + settings.ENDCBOLD)
-                logging.error(msg)
-                raise
-            try:
-                if(match_dolls):
-                    string = self._evaluate_static(string,
-                                                   match_dolls.group(1))
-                if(match_quest):
-                    string = self._evaluate_dynamic(string,
-                                                    match_quest.group(1))
-            except KeyError:
-                logging.error("unable to evaluate expression: '%s'",
-                              string)
-                raise
-            if(not match_dolls and not match_quest):
-                all_evaluated = True
-        return string
+        if not isinstance(string, str):
+            msg = ("Expression to evaluate is not of type String: " +
+                   settings.FAIL + "{}".format(string) + settings.ENDCBOLD)
+            logging.error(msg)
+            raise TypeError(msg)
+        try:
+            return self._evaluate_cached(string, self._cur_scope_value)
+        except KeyError:
+            logging.error("unable to evaluate expression: '%s'",
+                          string)
+            raise
+
+    @classmethod
+    @functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+    def _compile(cls, string):
+        return Template(string, cls._helpers)
+
+    @classmethod
+    @functools.lru_cache(maxsize=EVALUATION_CACHE_SIZE)
+    def _evaluate_cached(cls, string, cur_scope_value):
+        template = cls._compile(string)
+        if template.is_static:
+            return template.render(None)
+        return template.render(cls(cur_scope_value)._dynamic_value)
 
     def _evaluate_static(self, string, to_evaluate):
         """
         Subsitute the ${to_evaluate} key by the associated value
         found in DataModel in 'string'.
         """
-        return re.sub(r"\$\{" + to_evaluate + r"}",
-                      self._get_value_from_helpers(to_evaluate),
-                      string)
+        return string.replace("${" + to_evaluate + "}",
+                              self._get_value_from_helpers(to_evaluate))
 
     def _evaluate_dynamic(self, string, to_evaluate):
+        """
+        Subsitute the ?{to_evaluate} key in 'string' by its value for the
+        current scope value (see _dynamic_value).
+        """
+        return string.replace("?{" + to_evaluate + "}",
+                              self._dynamic_value(to_evaluate, string))
+
+    def _dynamic_value(self, to_evaluate, string=None):
         """
         First parse the ?{to_evaluate} key,
         if there is a match for '->' 'to_evaluate' is replaced
@@ -81,8 +110,7 @@ class Evaluator():
         filenames computed before. An error is raised if more than one match
         has been found.
 
-        Finally substitute the ?{to_evaluate} by what have been found
-        in 'yaml_string'
+        Finally return what have been found.
         """
         from data_model import DataModel
         match_redirect = re.search(r"(.*?)->(.*)", to_evaluate)
@@ -91,37 +119,55 @@ class Evaluator():
         if match_redirect:
             to_evaluate = match_redirect.group(1)
             scope_name = match_redirect.group(2)
-            scope = DataModel.scopes[scope_name]
-            scope_value = self.evaluate(scope.expression)
-            scope_value = re.match(scope_value, self._cur_scope_value).group(0)
+            scope_value = None
+            if DataModel.scope_tree is not None:
+                scope_value = DataModel.scope_tree.ancestor(
+                    self._cur_scope_value, scope_name)
+            if scope_value is None:
+                scope_value = self._redirect(scope_name)
 
-        files_matching_scope_value = [f for f in DataModel.files
-                                      if re.search(scope_value, f)]
+        files_matching_scope_value = DataModel.files_matching(scope_value)
         evaluated_value = set()
         evltr = Evaluator(scope_value)
-        reg_exp = evltr.evaluate(self._get_value_from_helpers(to_evaluate))
+        reg_exp = re.compile(
+            evltr.evaluate(self._get_value_from_helpers(to_evaluate)))
 
         for f in files_matching_scope_value:
-            match_eval = re.search(reg_exp, f)
+            match_eval = reg_exp.search(f)
             if match_eval:
                 evaluated_value.add(match_eval.group(0))
         if (len(evaluated_value) != 1):
             msg = ("Bad evaluation of '{0}', within: '{1}'\n"
                    "Matches are:{2}".format(to_substitute,
-                                            string,
+                                            string or "?{" + to_substitute +
+                                            "}",
                                             pformat(evaluated_value)))
             logging.error(msg)
             raise KeyError("")  # TODO: we should have our own exceptions.
-        new = evaluated_value.pop()
-        string = re.sub(r"\?\{" + to_substitute + r"\}", new, string)
-        return string
+        return evaluated_value.pop()
+
+    def _redirect(self, scope_name):
+        """
+        Value of the scope 'scope_name' matching the beginning of the
+        current scope value, for values not found in the scope tree.
+        """
+        from data_model import DataModel, escape_reserved_re_char
+        scope = DataModel.scopes[scope_name]
+        expression = self.evaluate(scope.expression)
+        literal = DataModel.literal_of(self._cur_scope_value)
+        if literal is not None:
+            # match the raw path, the value found is then escaped as
+            # the values of the targeted scope.
+            return escape_reserved_re_char(
+                re.match(expression, literal).group(0))
+        return re.match(expression, self._cur_scope_value).group(0)
 
     def _get_value_from_helpers(self, key):
         try:
             return self._helpers[key]
         except KeyError:
             msg = ("unable to find any key " +
-                   settings.FAIL + "{}".format(key), + settings.ENDCBOLD +
-                   "in configuration file")
+                   settings.FAIL + "{}".format(key) + settings.ENDCBOLD +
+                   " in configuration file")
             logging.critical(msg)
             raise
@@ -1,26 +1,102 @@
+import os
+import math
+import heapq
 import logging
+import asyncio
 from concurrent import futures
 from concurrent.futures import ThreadPoolExecutor
-from evaluator import Evaluator
-from yaml_io import YamlIO
 from yaml_io import Literal
+from journal import NodeJournal
+from output_log import OutputLog, log_filename
+from file_listing import stat_files
 from node import ROOT_NAME
 import settings
 import sys
 import subprocess
 import datetime
+import time
 from pprint import pformat
 from collections import OrderedDict
 
 
+# Fields of a status which may be missing from the statuses recorded by
+# previous versions.
+OPTIONAL_STATUS_FIELDS = ("start_date", "end_date", "duration", "user_time",
+                          "system_time", "max_rss_kb", "fingerprint", "log",
+                          "output_size")
+
+
 def remove_space_before_new_line(string):
     return ''.join([line.rstrip() + '\n' for line in string.splitlines()])
 
 
+def wait_with_rusage(process):
+    """
+    Wait for a subprocess.Popen to terminate and return its own resource
+    usage (see os.wait4), None if it can't be known on this platform.
+    """
+    if not hasattr(os, "wait4"):
+        process.wait()
+        return None
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of a non empty sorted list.
+    """
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def resources_summary(statuses):
+    """
+    Aggregates (p50, p95, max, total) of the wall time, the cpu time and the
+    max rss of the commands launched, from their statuses.
+    Return an OrderedDict {resource: {aggregate: value}}.
+    """
+    resources = OrderedDict([("wall_s", []), ("cpu_s", []),
+                             ("max_rss_kb", [])])
+    for status in statuses:
+        if status.get("context") not in ("EXECUTED", "ERROR"):
+            continue
+        if isinstance(status.get("duration"), (int, float)):
+            resources["wall_s"].append(status["duration"])
+        if isinstance(status.get("user_time"), (int, float)):
+            resources["cpu_s"].append(status["user_time"] +
+                                      status["system_time"])
+        if isinstance(status.get("max_rss_kb"), int):
+            resources["max_rss_kb"].append(status["max_rss_kb"])
+    summary = OrderedDict()
+    for name, values in resources.items():
+        if not values:
+            continue
+        values.sort()
+        summary[name] = OrderedDict([("p50", percentile(values, 50)),
+                                     ("p95", percentile(values, 95)),
+                                     ("max", values[-1]),
+                                     ("total", sum(values))])
+    return summary
+
+
 class PipelineExecutor():
     _pipeline = None
     _print_only = False
     _force_execution = False
+    _journals = None
+    _run_store = None
+    _fingerprinter = None
+    _fingerprints = None
+    _recorded_fingerprints = None
+    _dependencies_cache = None
+    _up_to_date = None
+    _produced_files = None
+    _executed = None
+    _executed_nodes = None
+    # Reentrant: the cached computations it protects call each other.
+    _FINGERPRINTS_LOCK = futures.thread.threading.RLock()
 
     @property
     def print_only(self):
@@ -30,6 +106,22 @@ class PipelineExecutor():
     def print_only(self, value):
         self._print_only = value
 
+    @property
+    def run_store(self):
+        return self._run_store
+
+    @run_store.setter
+    def run_store(self, value):
+        self._run_store = value
+
+    @property
+    def fingerprinter(self):
+        return self._fingerprinter
+
+    @fingerprinter.setter
+    def fingerprinter(self, value):
+        self._fingerprinter = value
+
     @property
     def force_execution(self):
         return self._print_only
@@ -54,6 +146,18 @@ class PipelineExecutor():
         sys.stdout.flush()
 
     def execute(self, node_name=None):
+        for n in self._nodes_to_execute(node_name):
+            if self._print_only:
+                self._print_one_node(n)
+            else:
+                self._execute_one_node(n)
+
+    def _nodes_to_execute(self, node_name=None):
+        """
+        List of the nodes to execute from the given node (root if None):
+        the node itself and all its descendants in a topological order.
+        """
+        nodes = []
         if node_name is None or node_name == ROOT_NAME:
             node = self._pipeline.root
         else:
@@ -65,15 +169,9 @@ class PipelineExecutor():
                        settings.BOLD + "'.\n in pipeline")
                 logging.critical(msg)
                 raise
-            if self._print_only:
-                self._print_one_node(node)
-            else:
-                self._execute_one_node(node)
-        for n in self._pipeline.walk(node):
-            if self._print_only:
-                self._print_one_node(n)
-            else:
-                self._execute_one_node(n)
+            nodes.append(node)
+        nodes.extend(self._pipeline.walk(node))
+        return nodes
 
     def _execute_one_node(self, node):
         pass
@@ -82,71 +180,467 @@ class PipelineExecutor():
         if self._print_only:
             print(settings.BOLD, "\nExecuting: ", node.name, settings.ENDC)
             for scope_value in node.scope.values:
-                evaluator = Evaluator(scope_value)
-                cmd_str = evaluator.evaluate(" ".join(node.cmd))
-                print(cmd_str)
+                print(" ".join(node.cmd_for_value(scope_value)))
+
+    def _node_status_filename(self, node):
+        return NodeJournal.snapshot_filename_of(node.name)
+
+    def _journal(self, node):
+        if self._journals is None:
+            self._journals = dict()
+        try:
+            return self._journals[node.name]
+        except KeyError:
+            journal = NodeJournal(self._node_status_filename(node))
+            self._journals[node.name] = journal
+            return journal
+
+    def _load_node_status(self, node):
+        """
+        Load the status of each scope value of the node from its last
+        execution, as a dictionary keyed by scope values.
+
+        The journal of the node is the reference: executions without the
+        run store update it too, the run store only records the attempts.
+        """
+        return self._journal(node).load()
+
+    def _record_status(self, node, scope_value, scope_value_status):
+        """
+        Save the status of a scope value as soon as it is known, so
+        statuses are always OK even if user plug off the computer.
+        """
+        self._journal(node).append(scope_value, scope_value_status)
+        if scope_value_status["context"] in ("EXECUTED", "ERROR"):
+            with self._FINGERPRINTS_LOCK:
+                if self._executed is None:
+                    self._executed = set()
+                    self._executed_nodes = set()
+                self._executed.add((node.name, scope_value))
+                self._executed_nodes.add(node.name)
+        if self._run_store is not None:
+            self._run_store.record(node.name, scope_value, scope_value_status)
+
+    def _close_node_status(self, node):
+        """
+        Called once all the scope values of the node are done.
+        """
+        self._journal(node).close()
+        if self._run_store is not None:
+            self._run_store.commit()
+
+    def _initial_scope_value_status(self, scope_values_status, scope_value):
+        """
+        The status of a scope value before its execution: the one of its
+        last execution if any.
+        """
+        scope_value_status = OrderedDict()
+        scope_value_status["execution_date"] = ""
+        scope_value_status["start_date"] = ""
+        scope_value_status["end_date"] = ""
+        scope_value_status["duration"] = ""
+        scope_value_status["user_time"] = ""
+        scope_value_status["system_time"] = ""
+        scope_value_status["max_rss_kb"] = ""
+        scope_value_status["status"] = ""
+        scope_value_status["context"] = ""
+        scope_value_status["cmd"] = ""
+        scope_value_status["fingerprint"] = ""
+        scope_value_status["log"] = ""
+        scope_value_status["output_size"] = 0
+        scope_value_status["message"] = Literal("\n")
+        try:
+            # ugly trick to reorder
+            d = scope_values_status[scope_value]
+            scope_value_status["execution_date"] = d["execution_date"]
+            scope_value_status["status"] = d["status"]
+            scope_value_status["context"] = d["context"]
+            scope_value_status["cmd"] = d["cmd"]
+            scope_value_status["message"] = Literal(d["message"])
+            # statuses dumped before they were there have none of the
+            # other fields.
+            for key in OPTIONAL_STATUS_FIELDS:
+                scope_value_status[key] = d.get(key, scope_value_status[key])
+        except KeyError:
+            pass
+        return scope_value_status
+
+    def _duration_estimates(self, node, scope_values_status, default=None):
+        """
+        Expected duration of the command of each scope value of the node,
+        from its last execution: its last duration, 0 if it is expected to
+        be skipped (last status SUCCESS), the median duration of the node
+        (or 'default') if it has never been measured.
+        Empty if nothing has ever been measured and 'default' is None.
+        """
+        durations = dict()
+        for v in node.scope.values:
+            duration = scope_values_status.get(v, {}).get("duration")
+            if isinstance(duration, (int, float)):
+                durations[v] = duration
+        if durations:
+            default = percentile(sorted(durations.values()), 50)
+        elif default is None:
+            return dict()
+        estimates = dict()
+        for v in node.scope.values:
+            status = scope_values_status.get(v, {})
+            if status.get("status") == "SUCCESS" and not self._force_execution:
+                estimates[v] = 0
+            else:
+                estimates[v] = durations.get(v, default)
+        return estimates
+
+    def _submission_order(self, node, scope_values_status):
+        """
+        Scope values of the node, the longest expected first (longest
+        processing time first shortens the tail of the node), in their
+        sorted order without history.
+        """
+        estimates = self._duration_estimates(node, scope_values_status)
+        if not estimates:
+            return list(node.scope.values)
+        # sorted is stable: equal estimates keep the scope values order.
+        return sorted(node.scope.values, key=lambda v: -estimates[v])
+
+    def _value_dependencies(self, tree, scope, parent_scope):
+        """
+        Dictionary {value of scope: values of parent_scope it depends on},
+        None if each value depends on all the values of parent_scope:
+            - the value of parent_scope containing (or equal to) it, if
+            parent_scope is coarser,
+            - the values of parent_scope it contains, if parent_scope is
+            finer.
+        """
+        ancestors = {v: tree.ancestor(v, parent_scope.name)
+                     for v in scope.values}
+        if all(a is not None for a in ancestors.values()):
+            return {v: [a] for v, a in ancestors.items()}
+        ancestors = {v: tree.ancestor(v, scope.name)
+                     for v in parent_scope.values}
+        if all(a is not None for a in ancestors.values()):
+            parent_values = {v: [] for v in scope.values}
+            for parent_value, value in ancestors.items():
+                parent_values[value].append(parent_value)
+            return parent_values
+        return None
+
+    def _upstream_tasks(self, node, scope_value):
+        """
+        Yield (parent node, values) for each parent node (but root) of the
+        node, 'values' being the scope values of the parent the scope value
+        depends on, None if it depends on all of them.
+        """
+        from data_model import DataModel
+        for parent_name in sorted(node.parents):
+            if parent_name == ROOT_NAME:
+                continue
+            parent = self._pipeline.nodes[parent_name]
+            key = (node.name, parent_name)
+            with self._FINGERPRINTS_LOCK:
+                if self._dependencies_cache is None:
+                    self._dependencies_cache = dict()
+                try:
+                    values = self._dependencies_cache[key]
+                except KeyError:
+                    values = self._value_dependencies(DataModel.scope_tree,
+                                                      node.scope,
+                                                      parent.scope)
+                    self._dependencies_cache[key] = values
+            if values is None:
+                yield parent, None
+            else:
+                yield parent, values[scope_value]
+
+    def _upstream_fingerprints(self, node, scope_value):
+        """
+        Fingerprints of the tasks of the parent nodes the scope value of the
+        node depends on.
+        """
+        fingerprints = []
+        for parent, values in self._upstream_tasks(node, scope_value):
+            if values is None:
+                fingerprints.append(self._node_fingerprint(parent))
+            else:
+                fingerprints.extend(self._task_fingerprint(parent, v)
+                                    for v in values)
+        return fingerprints
+
+    def _upstream_executed(self, node, scope_value):
+        """
+        True if a task the scope value of the node depends on has been
+        launched during this execution.
+        """
+        if not self._executed:
+            return False
+        for parent, values in self._upstream_tasks(node, scope_value):
+            if values is None:
+                if parent.name in self._executed_nodes:
+                    return True
+            elif any((parent.name, v) in self._executed for v in values):
+                return True
+        return False
+
+    def _up_to_date_values(self, node):
+        """
+        Set of the scope values of the node whose declared outputs
+        (__OUTPUTS__) all exist and are newer than their inputs (see
+        _input_files). All the files of the node are stat in
+        one pass, the first time it is called for the node.
+        """
+        with self._FINGERPRINTS_LOCK:
+            if self._up_to_date is None:
+                self._up_to_date = dict()
+            try:
+                return self._up_to_date[node.name]
+            except KeyError:
+                pass
+            up_to_date = set()
+            self._up_to_date[node.name] = up_to_date
+            outputs = {v: [os.path.abspath(o)
+                           for o in node.outputs_for_value(v)]
+                       for v in node.scope.values}
+            outputs = {v: o for v, o in outputs.items() if o}
+            if not outputs:
+                return up_to_date
+            all_outputs = set(o for os_ in outputs.values() for o in os_)
+            inputs = {v: [os.path.abspath(f)
+                          for f in self._input_files(node, v)]
+                      for v in outputs}
+            mtimes = stat_files(all_outputs.union(
+                f for fs in inputs.values() for f in fs))
+            for v, value_outputs in outputs.items():
+                output_mtimes = [mtimes[o] for o in value_outputs]
+                if None in output_mtimes:
+                    continue
+                input_mtimes = [mtimes[f] for f in inputs[v]
+                                if mtimes[f] is not None]
+                if min(output_mtimes) >= max(input_mtimes, default=0):
+                    up_to_date.add(v)
+            return up_to_date
+
+    def _pipeline_outputs(self):
+        """
+        Set of the absolute paths of the files declared as produced
+        (__OUTPUTS__) by any node of the pipeline.
+        """
+        with self._FINGERPRINTS_LOCK:
+            if self._produced_files is None:
+                self._produced_files = set(
+                    os.path.abspath(o)
+                    for n in self._pipeline.nodes.values() if n.outputs
+                    for v in n.scope.values
+                    for o in n.outputs_for_value(v))
+            return self._produced_files
+
+    def _input_files(self, node, scope_value):
+        """
+        The files matching the scope value the command of the node reads:
+        all of them but the ones produced by the pipeline, the declared
+        outputs of its nodes (the node itself and its descendants first) and
+        what presto writes in settings.PRESTO_DIR.
+        """
+        from data_model import DataModel
+        presto_dir = os.path.join(os.path.abspath(settings.PRESTO_DIR), "")
+        outputs = self._pipeline_outputs()
+        inputs = []
+        for f in DataModel.files_matching(scope_value):
+            f_abs = os.path.abspath(f)
+            if not f_abs.startswith(presto_dir) and f_abs not in outputs:
+                inputs.append(f)
+        return inputs
+
+    def _task_fingerprint(self, node, scope_value):
+        """
+        Fingerprint of a task computed during this execution, the recorded
+        one if the node isn't executed.
+        """
+        try:
+            return self._fingerprints[(node.name, scope_value)]
+        except KeyError:
+            pass
+        with self._FINGERPRINTS_LOCK:
+            if (node.name, None) not in self._recorded_fingerprints:
+                statuses = self._load_node_status(node)
+                for value, status in statuses.items():
+                    self._recorded_fingerprints[(node.name, value)] =\
+                        status.get("fingerprint", "")
+                self._recorded_fingerprints[(node.name, None)] = ""
+        return self._recorded_fingerprints.get((node.name, scope_value), "")
+
+    def _node_fingerprint(self, node):
+        """
+        Fingerprint of all the tasks of a node.
+        """
+        key = (node.name, None)
+        try:
+            return self._fingerprints[key]
+        except KeyError:
+            pass
+        fingerprint = self._fingerprinter.fingerprint(
+            [node.name], [], [self._task_fingerprint(node, v)
+                              for v in node.scope.values])
+        self._fingerprints[key] = fingerprint
+        return fingerprint
+
+    def _fingerprint(self, node, scope_value, cmd):
+        """
+        Fingerprint of the task of a scope value of a node: its command,
+        its input files and the fingerprints of the tasks upstream.
+        """
+        if self._fingerprinter is None or self._fingerprinter.mode == 'none':
+            return ""
+        with self._FINGERPRINTS_LOCK:
+            if self._fingerprints is None:
+                self._fingerprints = dict()
+                self._recorded_fingerprints = dict()
+        fingerprint = self._fingerprinter.fingerprint(
+            cmd, self._input_files(node, scope_value),
+            self._upstream_fingerprints(node, scope_value))
+        self._fingerprints[(node.name, scope_value)] = fingerprint
+        return fingerprint
+
+    def _command_to_launch(self, node, scope_value, scope_value_status):
+        """
+        Fill the status with the command of the scope value and return it,
+        None if it doesn't need to be launched.
+        """
+        cmd = node.cmd_for_value(scope_value)
+
+        cmd_str = " ".join(cmd)
+        scope_value_status["cmd"] = cmd_str
 
-    def _execute_one_scope_value(self, node, scope_value, scope_value_status):
-        return_status = scope_value_status
         # First we check if we actually need to launch the command.
         previous_succes = True
         try:
             assert scope_value_status["status"] == "SUCCESS"
         except (AssertionError, KeyError):
             previous_succes = False
+        # A previous success is outdated if the command, the inputs or
+        # something upstream changed since (statuses recorded without
+        # fingerprint are trusted).
+        fingerprint = self._fingerprint(node, scope_value, cmd)
+        previous_fingerprint = scope_value_status.get("fingerprint")
+        if previous_fingerprint and previous_fingerprint != fingerprint:
+            previous_succes = False
+        # Without status (e.g. .presto wiped out), declared outputs newer
+        # than the inputs mean the work is already done.
+        if (not scope_value_status["status"] and
+                not self._force_execution and
+                scope_value in self._up_to_date_values(node) and
+                not self._upstream_executed(node, scope_value)):
+            scope_value_status["fingerprint"] = fingerprint
+            scope_value_status["status"] = "SUCCESS"
+            scope_value_status["context"] = "UP_TO_DATE"
+            return None
+        scope_value_status["fingerprint"] = fingerprint
         # Update context if previous success.
         if previous_succes:
-            return_status["context"] = "NO_WORK_TO_DO"
+            scope_value_status["context"] = "NO_WORK_TO_DO"
 
-        evaluator = Evaluator(scope_value)
-        cmd = [evaluator.evaluate(arg) for arg in node.cmd]
+        if not previous_succes or self._force_execution:
+            return cmd
+        return None
 
-        cmd_str = " ".join(cmd)
-        return_status["cmd"] = cmd_str
+    def _set_output_status(self, return_status, returncode, log):
+        """
+        Fill the status with the result of a command which has been
+        launched: its return code and its output (stdout and stderr) log,
+        only the tail of the output is kept in the status.
+        """
+        # use the dumb litteral class derived from str
+        # so it will be dump as litteral by PyYAML (see yaml_io module)
+        # We have to remove all space before \n otherwise PyYAML fail
+        # to dump it as a literal
+        output = remove_space_before_new_line(log.tail())
+        if returncode == 0:
+            return_status["execution_date"] = datetime.datetime.now()
+            return_status["status"] = "SUCCESS"
+            return_status["context"] = "EXECUTED"
+        else:
+            return_status["status"] = "FAILURE"
+            return_status["context"] = "ERROR"
+        return_status["log"] = str(log.filename)
+        return_status["output_size"] = log.size
+        return_status["message"] = Literal(output + "\n")
 
-        if not previous_succes or self._force_execution:
-            try:
-                output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
-                return_status["execution_date"] = datetime.datetime.now()
-
-                # decode bytes output with encoding used by stdout
-                # and then use the dumb litteral class derived from str
-                # so it will be dump as litteral by PyYAML (see yaml_io module)
-                output = output.decode(sys.stdout.encoding)
-                # We have to remove all space before \n otherwise PyYAML fail
-                # to dump it as a literal
-                output = remove_space_before_new_line(output)
-                return_status["status"] = "SUCCESS"
-                return_status["context"] = "EXECUTED"
-                return_status["message"] = Literal(output + "\n")
-
-            except subprocess.CalledProcessError as err:
-                error = err.output.decode(sys.stdout.encoding)
-                return_status["status"] = "FAILURE"
-                return_status["context"] = "ERROR"
-                error = remove_space_before_new_line(error)
-                return_status["message"] = Literal(error + "\n")
-            except PermissionError as perm_err:
-                logging.error("Permission denied to launch '%s':\n%s",
-                              " ".join(cmd),
-                              perm_err)
-                return_status["status"] = "FAILURE"
-                return_status["context"] = "PERMISSION_DENIED"
-                perm_err = remove_space_before_new_line(perm_err.strerror)
-                return_status["message"] = Literal(perm_err + "\n")
-            except FileNotFoundError as file_err:
-                # This exception is raised if the first arg of cmd
-                # is not a valid comand.
-                return_status["status"] = "FAILURE"
-                return_status["context"] = "COMMAND_NOT_FOUND"
-                file_err = remove_space_before_new_line(file_err.strerror)
-                return_status["message"] = Literal(file_err + "\n")
-            except TypeError as type_err:
-                return_status["status"] = "FAILURE"
-                return_status["context"] = "BAD FORMAT"
-                type_err = remove_space_before_new_line(type_err.strerror)
-                return_status["message"] = Literal(type_err + "\n")
+    def _set_launch_error_status(self, return_status, cmd, err):
+        """
+        Fill the status of a command which couldn't be launched.
+        """
+        if isinstance(err, PermissionError):
+            logging.error("Permission denied to launch '%s':\n%s",
+                          " ".join(cmd),
+                          err)
+            context = "PERMISSION_DENIED"
+        elif isinstance(err, FileNotFoundError):
+            # This exception is raised if the first arg of cmd
+            # is not a valid comand.
+            context = "COMMAND_NOT_FOUND"
+        else:
+            context = "BAD FORMAT"
+        message = getattr(err, "strerror", None) or str(err)
+        return_status["status"] = "FAILURE"
+        return_status["context"] = context
+        return_status["log"] = ""
+        return_status["output_size"] = 0
+        message = remove_space_before_new_line(message)
+        return_status["message"] = Literal(message + "\n")
+
+    def _set_resources_status(self, return_status, start, rusage=None):
+        """
+        Fill the status with the end date, the wall time of a command
+        started at 'start' (time.monotonic) and its cpu times and max rss
+        from its rusage, if known.
+        """
+        return_status["end_date"] = datetime.datetime.now()
+        return_status["duration"] = round(time.monotonic() - start, 3)
+        if rusage is None:
+            return
+        return_status["user_time"] = round(rusage.ru_utime, 3)
+        return_status["system_time"] = round(rusage.ru_stime, 3)
+        max_rss = rusage.ru_maxrss
+        if sys.platform == "darwin":
+            # in bytes on macOS, in kilobytes elsewhere
+            max_rss //= 1024
+        return_status["max_rss_kb"] = max_rss
+
+    def _print_resources(self, node, scope_values_status):
+        """
+        Print and log the aggregated resources used by the commands of the
+        node launched during this execution.
+        """
+        summary = resources_summary(scope_values_status[v]
+                                    for v in node.scope.values
+                                    if v in scope_values_status)
+        if not summary:
+            return
+        lines = ["{}: {}".format(name, ", ".join(
+            "{} {:.6g}".format(k, v) for k, v in aggregates.items()))
+            for name, aggregates in summary.items()]
+        print("    " + "\n    ".join(lines))
+        logging.info("Resources of %s:\n%s", node.name, pformat(summary))
 
+    def _execute_one_scope_value(self, node, scope_value, scope_value_status):
+        return_status = scope_value_status
+        cmd = self._command_to_launch(node, scope_value, return_status)
+        if cmd is None:
+            return return_status
+        start = time.monotonic()
+        return_status["start_date"] = datetime.datetime.now()
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+        except (PermissionError, FileNotFoundError, TypeError) as err:
+            # no log file for a command which couldn't be launched.
+            self._set_launch_error_status(return_status, cmd, err)
+            self._set_resources_status(return_status, start)
+            return return_status
+        with process, OutputLog(log_filename(node.name, scope_value)) as log:
+            log.copy(process.stdout)
+            rusage = wait_with_rusage(process)
+        self._set_output_status(return_status, process.returncode, log)
+        self._set_resources_status(return_status, start, rusage)
         return return_status
 
 
@@ -166,9 +660,9 @@ class ThreadedPipelineExecutor(PipelineExecutor):
         for each scope values of the given node.
         Submitting a command give back a future object which is
         an observer on the state of the command.
-        As each command is completed (success or failur) we dump a yaml
-        document resuming the state of all command and update the progression
-        on the standard output.
+        As each command is completed (success or failur) we record its state
+        in the journal of the node and update the progression on the standard
+        output.
         """
 
         # A dictionary Key are the scope value,
@@ -176,12 +670,7 @@ class ThreadedPipelineExecutor(PipelineExecutor):
         # This dict is what is load/dump in yaml
         max_workers = self._max_workers * node.workers_modifier
 
-        node_filname = settings.PRESTO_DIR.joinpath(node.name +
-                                                    settings.NODE_EXEC_SUFFIX)
-        if node_filname.exists():
-            scope_values_status = YamlIO.load_yaml(node_filname)
-        else:
-            scope_values_status = dict()
+        scope_values_status = self._load_node_status(node)
 
         # A dictionary that list all the observer
         # and its corresponding scope_value.
@@ -190,23 +679,10 @@ class ThreadedPipelineExecutor(PipelineExecutor):
         # A list of the scope value for which the cmd fail
         scope_values_failed = []
         with ThreadPoolExecutor(max_workers=max_workers) as ex:
-            for scope_value in node.scope.values:
-                scope_value_status = OrderedDict()
-                scope_value_status["execution_date"] = ""
-                scope_value_status["status"] = ""
-                scope_value_status["context"] = ""
-                scope_value_status["cmd"] = ""
-                scope_value_status["message"] = Literal("\n")
-                try:
-                    # ugly trick to reorder
-                    d = scope_values_status[scope_value]
-                    scope_value_status["execution_date"] = d["execution_date"]
-                    scope_value_status["status"] = d["status"]
-                    scope_value_status["context"] = d["context"]
-                    scope_value_status["cmd"] = d["cmd"]
-                    scope_value_status["message"] = Literal(d["message"])
-                except KeyError:
-                    pass
+            for scope_value in self._submission_order(node,
+                                                      scope_values_status):
+                scope_value_status = self._initial_scope_value_status(
+                    scope_values_status, scope_value)
                 observer = ex.submit(self._execute_one_scope_value,
                                      node,
                                      scope_value,
@@ -231,12 +707,360 @@ class ThreadedPipelineExecutor(PipelineExecutor):
                     progression_percent = progression / len(node.scope.values)
                     self._print_progression(node.description,
                                             progression_percent, is_ok)
-                # dump results, must be here in case after each futur
-                # get completed so yaml results are always OK even if user
+                # record results, must be here in case after each futur
+                # get completed so results are always OK even if user
                 # plug off the computer.
-                YamlIO.dump_yaml(scope_values_status, node_filname)
+                self._record_status(node, scope_value, status)
+        self._close_node_status(node)
         # print new line
         print("")
+        self._print_resources(node, scope_values_status)
         if scope_values_failed:
             logging.error("Failed scope value: \n%s",
                           pformat(scope_values_failed))
+
+
+class DagPipelineExecutor(ThreadedPipelineExecutor):
+    """
+    Execute the pipeline (node, scope value) by (node, scope value) instead
+    of node by node.
+
+    A task of a node is launched as soon as the tasks it depends on in the
+    parent nodes have succeeded, so one slow scope value doesn't hold all
+    the others at each node boundary. Between a node and one of its parents
+    a task depends on:
+        - the task of the parent value containing (or equal to) its value,
+        if the parent scope is coarser,
+        - the tasks of the parent values it contains, if the parent scope
+        is finer,
+        - all the tasks of the parent otherwise.
+    When a task fails, the tasks depending on it are not launched and get
+    the context 'PARENT_FAILED'.
+
+    All the tasks share one budget of 'max_workers' workers, a task of a
+    node using 1 / __WORKERS_MODIFIER__ of them (see _task_cost).
+    """
+
+    def execute(self, node_name=None):
+        if self._print_only:
+            return super().execute(node_name)
+        nodes = [n for n in self._nodes_to_execute(node_name)
+                 if n.name != ROOT_NAME]
+        self._schedule(nodes)
+
+    def _task_cost(self, node):
+        """
+        Number of workers used by one task of the node.
+
+        A __WORKERS_MODIFIER__ of 0.5 means that a command uses two CPUs, so
+        it costs two workers, and one of 0.4 (2.5 CPUs) costs three. It is
+        never less than one worker (so no more than 'max_workers' commands
+        run together) and never more than 'max_workers' (so the task can
+        run at all).
+        """
+        try:
+            # the epsilon absorbs float noise, 1 / (1 / 49) isn't 49.
+            cost = math.ceil(1 / node.workers_modifier - 1e-9)
+        except (ZeroDivisionError, TypeError):
+            cost = 1
+        return min(max(1, cost), self._budget())
+
+    def _budget(self):
+        return max(1, int(self._max_workers))
+
+    def _task_dependencies(self, nodes):
+        """
+        Return a dictionary {task: set of tasks it depends on}, a task being
+        a tuple (node name, scope value).
+
+        A task (node name, None) is a barrier: it depends on all the tasks of
+        the node, it isn't executed and is done as soon as they are.
+        """
+        from data_model import DataModel
+        tree = DataModel.scope_tree
+        by_name = {n.name: n for n in nodes}
+        dependencies = dict()
+        for node in nodes:
+            for value in node.scope.values:
+                dependencies[(node.name, value)] = set()
+            for parent_name in node.parents:
+                if parent_name not in by_name:
+                    # root or a node which isn't executed this time.
+                    continue
+                parent = by_name[parent_name]
+                parent_values = self._parent_values(tree, node.scope,
+                                                    parent.scope)
+                if parent_values is None:
+                    barrier = (parent_name, None)
+                    dependencies[barrier] = set(
+                        (parent_name, v) for v in parent.scope.values)
+                    for value in node.scope.values:
+                        dependencies[(node.name, value)].add(barrier)
+                    continue
+                for value, values in parent_values.items():
+                    dependencies[(node.name, value)].update(
+                        (parent_name, v) for v in values)
+        return dependencies
+
+    def _parent_values(self, tree, scope, parent_scope):
+        """
+        Dictionary {value of scope: values of parent_scope it depends on},
+        None if each value depends on all the values of parent_scope.
+        """
+        return self._value_dependencies(tree, scope, parent_scope)
+
+    def _critical_path_priorities(self, nodes, statuses, dependencies,
+                                  dependents):
+        """
+        Priority of each task: the expected duration of the longest chain
+        of tasks starting with it (its critical path), from the durations
+        of the last executions. Empty without any history: tasks are then
+        launched in topological and scope values order.
+        """
+        known = sorted(s["duration"] for n in nodes
+                       for s in statuses[n.name].values()
+                       if isinstance(s.get("duration"), (int, float)))
+        if not known:
+            return dict()
+        default = percentile(known, 50)
+        estimates = dict()
+        for n in nodes:
+            for v, e in self._duration_estimates(n, statuses[n.name],
+                                                 default).items():
+                estimates[(n.name, v)] = e
+        # tasks in a topological order (Kahn), then from the last ones.
+        remaining = {t: len(deps) for t, deps in dependencies.items()}
+        order = [t for t, r in remaining.items() if r == 0]
+        for task in order:
+            for child in dependents.get(task, []):
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    order.append(child)
+        priorities = dict()
+        for task in reversed(order):
+            priorities[task] = estimates.get(task, 0) + max(
+                (priorities[c] for c in dependents.get(task, [])), default=0)
+        return priorities
+
+    def _schedule(self, nodes):
+        by_name = {n.name: n for n in nodes}
+        dependencies = self._task_dependencies(nodes)
+        dependents = dict()
+        for task, deps in dependencies.items():
+            for dep in deps:
+                dependents.setdefault(dep, []).append(task)
+
+        statuses = {n.name: self._load_node_status(n) for n in nodes}
+        remaining = {n.name: len(n.scope.values) for n in nodes}
+        progression = {n.name: 0 for n in nodes}
+        failed = {n.name: [] for n in nodes}
+        costs = {n.name: self._task_cost(n) for n in nodes}
+        budget = self._budget()
+        used = 0
+        priorities = self._critical_path_priorities(nodes, statuses,
+                                                    dependencies, dependents)
+        # ready tasks, the highest priority first, then in topological and
+        # scope values order.
+        rank = dict()
+        for i, n in enumerate(nodes):
+            for j, v in enumerate(n.scope.values):
+                rank[(n.name, v)] = (i, j)
+        ready = []
+
+        def push(task):
+            heapq.heappush(ready, (-priorities.get(task, 0), rank[task],
+                                   task))
+
+        def release(task, succeeded):
+            """
+            Remove a done task from the dependencies of the others, launching
+            the ones having no more dependency or skipping them if the task
+            failed.
+            """
+            done = [(task, succeeded)]
+            while done:
+                task, succeeded = done.pop()
+                del dependencies[task]
+                for child in dependents.get(task, []):
+                    if child not in dependencies:
+                        continue
+                    if not succeeded:
+                        skip(child)
+                        done.append((child, False))
+                        continue
+                    dependencies[child].discard(task)
+                    if dependencies[child]:
+                        continue
+                    if child[1] is None:
+                        done.append((child, True))
+                    else:
+                        push(child)
+
+        def finish(node_name, scope_value, status):
+            node = by_name[node_name]
+            statuses[node_name][scope_value] = status
+            remaining[node_name] -= 1
+            if status["status"] == "SUCCESS":
+                progression[node_name] += 1
+            else:
+                failed[node_name].append(scope_value)
+            with self._LOCK:
+                self._print_progression(
+                    node.description,
+                    progression[node_name] / len(node.scope.values),
+                    not failed[node_name])
+            self._record_status(node, scope_value, status)
+            if remaining[node_name] == 0:
+                self._close_node_status(node)
+                # print new line
+                print("")
+                self._print_resources(node, statuses[node_name])
+                if failed[node_name]:
+                    logging.error("Failed scope value in %s: \n%s",
+                                  node_name, pformat(failed[node_name]))
+
+        def skip(task):
+            """
+            Mark a task as not launched because of a failed parent.
+            """
+            node_name, scope_value = task
+            if scope_value is None:
+                return
+            status = self._initial_scope_value_status(
+                statuses[node_name], scope_value)
+            if status["status"] != "SUCCESS":
+                status["status"] = "FAILURE"
+            status["context"] = "PARENT_FAILED"
+            finish(node_name, scope_value, status)
+
+        for task in [t for t, deps in dependencies.items() if not deps]:
+            if task in dependencies:
+                if task[1] is None:
+                    # barrier of a node without scope value.
+                    release(task, True)
+                else:
+                    push(task)
+
+        running = dict()
+        with ThreadPoolExecutor(max_workers=budget) as ex:
+            while True:
+                # A task waiting for workers isn't overtaken by the next
+                # ones, so it can't be starved.
+                while ready and used + costs[ready[0][2][0]] <= budget:
+                    node_name, scope_value = heapq.heappop(ready)[2]
+                    status = self._initial_scope_value_status(
+                        statuses[node_name], scope_value)
+                    future = ex.submit(self._execute_one_scope_value,
+                                       by_name[node_name], scope_value,
+                                       status)
+                    running[future] = (node_name, scope_value)
+                    used += costs[node_name]
+                if not running:
+                    break
+                done, _ = futures.wait(running,
+                                       return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    node_name, scope_value = task
+                    used -= costs[node_name]
+                    status = future.result()
+                    finish(node_name, scope_value, status)
+                    release(task, status["status"] == "SUCCESS")
+
+
+class ParallelPipelineExecutor(DagPipelineExecutor):
+    """
+    Execute the pipeline node by node, like ThreadedPipelineExecutor, but
+    launch together the nodes whose parents are all done (e.g. two nodes
+    depending only on the same one), sharing the same workers.
+    A node isn't launched if a scope value of one of its parents failed.
+    """
+
+    def _parent_values(self, tree, scope, parent_scope):
+        return None
+
+
+class AsyncPipelineExecutor(PipelineExecutor):
+    """
+    Execute the pipeline node by node like ThreadedPipelineExecutor, but
+    launch the commands with asyncio subprocesses from one thread instead
+    of one thread per command, so thousands of commands can be in flight
+    (e.g. with a high --workers for I/O bound commands).
+    """
+    _max_workers = 0
+
+    def __init__(self, pipeline, max_workers):
+        self._max_workers = max_workers
+        self._pipeline = pipeline
+
+    def _execute_one_node(self, node):
+        asyncio.run(self._execute_one_node_async(node))
+
+    async def _execute_one_node_async(self, node):
+        max_workers = max(1, int(self._max_workers * node.workers_modifier))
+        semaphore = asyncio.Semaphore(max_workers)
+        scope_values_status = self._load_node_status(node)
+        tasks = [self._execute_one_scope_value_async(
+            node, scope_value,
+            self._initial_scope_value_status(scope_values_status,
+                                             scope_value),
+            semaphore) for scope_value in self._submission_order(
+                node, scope_values_status)]
+
+        progression = 0
+        is_ok = True
+        scope_values_failed = []
+        for task in asyncio.as_completed(tasks):
+            scope_value, status = await task
+            scope_values_status[scope_value] = status
+            if status["status"] == "SUCCESS":
+                progression += 1
+            else:
+                is_ok = False
+                scope_values_failed.append(scope_value)
+            self._print_progression(node.description,
+                                    progression / len(node.scope.values),
+                                    is_ok)
+            self._record_status(node, scope_value, status)
+        self._close_node_status(node)
+        # print new line
+        print("")
+        self._print_resources(node, scope_values_status)
+        if scope_values_failed:
+            logging.error("Failed scope value: \n%s",
+                          pformat(scope_values_failed))
+
+    async def _execute_one_scope_value_async(self, node, scope_value,
+                                             scope_value_status, semaphore):
+        """
+        Same as _execute_one_scope_value, return the scope value with its
+        status.
+        """
+        return_status = scope_value_status
+        cmd = self._command_to_launch(node, scope_value, return_status)
+        if cmd is None:
+            return scope_value, return_status
+        async with semaphore:
+            start = time.monotonic()
+            return_status["start_date"] = datetime.datetime.now()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT)
+            except (PermissionError, FileNotFoundError, TypeError) as err:
+                self._set_launch_error_status(return_status, cmd, err)
+                process = None
+            if process is not None:
+                with OutputLog(log_filename(node.name, scope_value)) as log:
+                    while True:
+                        chunk = await process.stdout.read(2**16)
+                        if not chunk:
+                            break
+                        log.write(chunk)
+                    await process.wait()
+                self._set_output_status(return_status, process.returncode,
+                                        log)
+            # asyncio reaps its children itself, their rusage is lost.
+            self._set_resources_status(return_status, start)
+        return scope_value, return_status
@@ -0,0 +1,296 @@
+import os
+import time
+import marshal
+import hashlib
+import logging
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+import settings
+from file_table import FileTable
+
+try:
+    import path
+except ImportError:
+    logging.critical("Presto requiered path.py to be installed, "
+                     "checkout requirement.txt.")
+    raise
+
+
+# Bump it each time the layout of the snapshot changes.
+SNAPSHOT_VERSION = 1
+
+# A directory modified less than this number of nanoseconds before a scan
+# may be modified again during the same mtime tick (think NFS): its mtime
+# is not trusted and it will be rescanned next time.
+RACY_DELAY_NS = 2 * 10**9
+
+
+def scan_directory(dirname):
+    """
+    List the content of a directory with a single scandir.
+    Return a tuple (mtime_ns, files, subdirectories), names are sorted.
+    """
+    mtime_ns = os.stat(dirname).st_mtime_ns
+    files = []
+    subdirs = []
+    with os.scandir(dirname) as it:
+        for entry in it:
+            # Same rules than path.py's walkfiles: symbolic links are
+            # followed and broken ones are ignored.
+            if entry.is_file():
+                files.append(entry.name)
+            elif entry.is_dir():
+                subdirs.append(entry.name)
+    return (mtime_ns, tuple(sorted(files)), tuple(sorted(subdirs)))
+
+
+def stat_files(files):
+    """
+    Modification time (in ns) of each of the files, None for the missing
+    ones, as a dictionary keyed by the given file names.
+    Files are grouped by directory: a directory holding several of them is
+    read once with scandir, only the files found in it are stat.
+    """
+    by_directory = dict()
+    for f in files:
+        dirname, name = os.path.split(os.path.abspath(f))
+        by_directory.setdefault(dirname, dict()).setdefault(name, []).append(f)
+    mtimes = dict()
+    for dirname, names in by_directory.items():
+        for fs in names.values():
+            for f in fs:
+                mtimes[f] = None
+        if len(names) == 1:
+            # don't read a whole directory for one file.
+            name, fs = next(iter(names.items()))
+            try:
+                mtime_ns = os.stat(os.path.join(dirname, name)).st_mtime_ns
+            except OSError:
+                continue
+            for f in fs:
+                mtimes[f] = mtime_ns
+            continue
+        try:
+            with os.scandir(dirname) as it:
+                for entry in it:
+                    if entry.name not in names:
+                        continue
+                    try:
+                        mtime_ns = entry.stat().st_mtime_ns
+                    except OSError:
+                        continue
+                    for f in names[entry.name]:
+                        mtimes[f] = mtime_ns
+        except OSError:
+            # missing directory: its files are missing.
+            pass
+    return mtimes
+
+
+class FileListing():
+    """
+    List recursively all the files under a root directory.
+
+    When a cache directory is given, a snapshot of the listing is kept in
+    it (one per root). On the next walk only the directories whose mtime
+    changed are scanned again, the content of the others is taken from
+    the snapshot: a warm start only costs a stat per directory.
+
+    With more than one worker, directories are refreshed concurrently by a
+    pool of threads, which hides the latency of networked file systems.
+
+    'accept' is an optional callable (see walk_filter.WalkFilter) telling
+    if a directory has to be walked, the others are skipped.
+
+    The directories of presto (settings.PRESTO_DIR and the cache directory)
+    are never walked, even when they are under root: what presto writes
+    there (the logs of the commands...) isn't data.
+    """
+    _root = None
+    _cache_dir = None
+    _workers = 1
+    _accept = None
+    _excluded = None
+
+    def __init__(self, root, cache_dir=None, workers=1, accept=None):
+        self._root = path.Path(root).abspath()
+        if cache_dir:
+            self._cache_dir = path.Path(cache_dir)
+        self._workers = max(1, workers)
+        self._accept = accept
+        # relative paths of the directories of presto under root
+        self._excluded = set()
+        for d in (settings.PRESTO_DIR, cache_dir):
+            if not d:
+                continue
+            relative = os.path.relpath(os.path.abspath(d), self._root)
+            if relative.split(os.sep)[0] not in (os.curdir, os.pardir):
+                self._excluded.add(relative)
+
+    @property
+    def root(self):
+        return self._root
+
+    @property
+    def snapshot_filename(self):
+        """
+        Snapshot file for this root or None if there is no cache.
+        """
+        if self._cache_dir is None:
+            return None
+        key = hashlib.sha1(self._root.encode('utf-8', 'surrogateescape'))
+        return self._cache_dir.joinpath("files-" + key.hexdigest()[:16] +
+                                        settings.FILE_LISTING_SUFFIX)
+
+    def walk(self, use_snapshot=True):
+        """
+        Return the sorted list of all files under root in a FileTable.
+        If 'use_snapshot' is False the previous snapshot is ignored and
+        the whole tree is scanned again (the snapshot is still updated).
+        """
+        snapshot = self._load_snapshot() if use_snapshot else dict()
+        scan_start_ns = time.time_ns()
+        directories = self._walk_directories(snapshot, scan_start_ns)
+        if self._accept is None:
+            self._save_snapshot(directories)
+        else:
+            # Keep what is known of the skipped directories, it is still
+            # checked against their mtime when used (but not the ones of
+            # presto, which older snapshots may hold).
+            merged = {d: e for d, e in snapshot.items()
+                      if not self._is_excluded(d)}
+            merged.update(directories)
+            self._save_snapshot(merged)
+        files = self._file_table(directories)
+        rescanned = sum(1 for d, e in directories.items()
+                        if snapshot.get(d) is not e)
+        logging.info("listed %s files in %s directories under %s "
+                     "(%s directories rescanned)", len(files),
+                     len(directories), self._root, rescanned)
+        return files
+
+    def _file_table(self, directories):
+        """
+        Fill a FileTable with the files of the walked directories, in the
+        order of their sorted paths without building them all: below a
+        directory its files and subdirectories (as 'name/') are sorted
+        together, the files of a subdirectory all coming at its place.
+        """
+        table = FileTable()
+        stack = [(self._root, iter([("", "")]))]
+        while stack:
+            dirname, entries = stack[-1]
+            try:
+                key, relative = next(entries)
+            except StopIteration:
+                stack.pop()
+                continue
+            if relative is None:
+                table.append(dirname, key)
+                continue
+            _, names, subdirs = directories[relative]
+            children = [(name, None) for name in names]
+            children.extend((d + "/", os.path.join(relative, d))
+                            for d in subdirs
+                            if os.path.join(relative, d) in directories)
+            children.sort()
+            stack.append((os.path.join(self._root, relative),
+                          iter(children)))
+        return table.freeze()
+
+    def _walk_directories(self, snapshot, scan_start_ns):
+        """
+        Return a dictionary {relative directory: (mtime_ns, files, subdirs)}
+        for every directory under root.
+        """
+        if self._workers > 1:
+            return self._walk_directories_threaded(snapshot, scan_start_ns)
+        directories = dict()
+        pending = [""]
+        while pending:
+            relative = pending.pop()
+            entry = self._refresh_one(relative, snapshot, scan_start_ns)
+            directories[relative] = entry
+            pending.extend(self._subdirectories(relative, entry))
+        return directories
+
+    def _walk_directories_threaded(self, snapshot, scan_start_ns):
+        """
+        Same as _walk_directories, but each directory is refreshed in a pool
+        of threads: as soon as a directory is known its subdirectories are
+        submitted, so every worker always has something to stat or scan.
+        """
+        directories = dict()
+        with ThreadPoolExecutor(max_workers=self._workers) as ex:
+            running = {ex.submit(self._refresh_one, "", snapshot,
+                                 scan_start_ns): ""}
+            while running:
+                done, _ = futures.wait(running,
+                                       return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    relative = running.pop(future)
+                    # Any OSError is raised here, as in the sequential walk.
+                    entry = future.result()
+                    directories[relative] = entry
+                    for child in self._subdirectories(relative, entry):
+                        running[ex.submit(self._refresh_one, child,
+                                          snapshot, scan_start_ns)] = child
+        return directories
+
+    def _subdirectories(self, relative, entry):
+        """
+        Relative path of the subdirectories of a directory to walk.
+        """
+        subdirs = [os.path.join(relative, d) for d in entry[2]
+                   if os.path.join(relative, d) not in self._excluded]
+        if self._accept is None:
+            return subdirs
+        return [d for d in subdirs
+                if self._accept(os.path.join(self._root, d))]
+
+    def _is_excluded(self, relative):
+        return any(relative == d or relative.startswith(d + os.sep)
+                   for d in self._excluded)
+
+    def _refresh_one(self, relative, snapshot, scan_start_ns):
+        """
+        Return the content of one directory, from the snapshot if its mtime
+        didn't change since, from a fresh scan otherwise.
+        """
+        dirname = os.path.join(self._root, relative)
+        previous = snapshot.get(relative)
+        if previous is not None and previous[0] is not None:
+            if os.stat(dirname).st_mtime_ns == previous[0]:
+                return previous
+        mtime_ns, files, subdirs = scan_directory(dirname)
+        if mtime_ns >= scan_start_ns - RACY_DELAY_NS:
+            mtime_ns = None
+        return (mtime_ns, files, subdirs)
+
+    def _load_snapshot(self):
+        filename = self.snapshot_filename
+        if filename is None or not filename.exists():
+            return dict()
+        try:
+            with open(filename, 'rb') as stream:
+                version, root, directories = marshal.load(stream)
+        except (OSError, EOFError, ValueError, TypeError):
+            logging.warning("Unable to read files snapshot %s, "
+                            "__ROOT__ will be walked entirely.", filename)
+            return dict()
+        if version != SNAPSHOT_VERSION or root != self._root:
+            return dict()
+        return directories
+
+    def _save_snapshot(self, directories):
+        filename = self.snapshot_filename
+        if filename is None:
+            return
+        tmp_filename = filename + ".tmp"
+        try:
+            with open(tmp_filename, 'wb') as stream:
+                marshal.dump((SNAPSHOT_VERSION, str(self._root), directories),
+                             stream)
+            os.replace(tmp_filename, filename)
+        except OSError:
+            logging.warning("Unable to write files snapshot %s", filename)
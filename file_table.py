@@ -0,0 +1,119 @@
+import os
+import bisect
+from array import array
+
+try:
+    import path
+except ImportError:
+    import logging
+    logging.critical("Presto requiered path.py to be installed, "
+                     "checkout requirement.txt.")
+    raise
+
+
+class FileTable():
+    """
+    A sorted list of file paths stored compactly.
+
+    Each directory is stored once, each file only keeps the index of its
+    directory and its basename, the basenames being packed in one utf-8
+    buffer indexed by offsets. This is a few bytes per file instead of a
+    full path.Path object.
+
+    It behaves like a read-only sorted list of path.Path: len(), iteration,
+    indexing and slicing (which gives a list), so bisect works on it.
+    """
+    _dirs = None
+    _dir_ids = None
+    _dir_index = None
+    _names = None
+    _offsets = None
+
+    def __init__(self, files=None):
+        """
+        'files', if given, must be sorted.
+        """
+        self._dirs = []
+        self._dir_ids = dict()
+        self._dir_index = array('I')
+        self._names = bytearray()
+        self._offsets = array('Q', [0])
+        if files is not None:
+            for f in files:
+                dirname, name = os.path.split(f)
+                self.append(dirname, name)
+
+    def append(self, dirname, name):
+        """
+        Add a file at the end of the table, files have to be appended in
+        sorted order.
+        """
+        try:
+            dir_id = self._dir_ids[dirname]
+        except KeyError:
+            dir_id = len(self._dirs)
+            self._dirs.append(os.path.join(dirname, ""))
+            self._dir_ids[dirname] = dir_id
+        self._dir_index.append(dir_id)
+        self._names += name.encode('utf-8', 'surrogateescape')
+        self._offsets.append(len(self._names))
+
+    def freeze(self):
+        """
+        Release what is only needed to append files.
+        """
+        self._dir_ids = dict()
+        return self
+
+    def _get(self, i):
+        name = self._names[self._offsets[i]:self._offsets[i + 1]]
+        return path.Path(self._dirs[self._dir_index[i]] +
+                         name.decode('utf-8', 'surrogateescape'))
+
+    def __len__(self):
+        return len(self._dir_index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._get(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("FileTable index out of range")
+        return self._get(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def __contains__(self, f):
+        return self.index(f) is not None
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return "FileTable({} files in {} directories)".format(
+            len(self), len(self._dirs))
+
+    def index(self, f):
+        """
+        Index of the file 'f', None if it isn't in the table.
+        """
+        i = bisect.bisect_left(self, f)
+        if i < len(self) and self._get(i) == f:
+            return i
+        return None
+
+    def nbytes(self):
+        """
+        Approximative memory used by the table.
+        """
+        return (self._dir_index.itemsize * len(self._dir_index) +
+                len(self._names) +
+                self._offsets.itemsize * len(self._offsets) +
+                sum(len(d) + 49 for d in self._dirs) + 8 * len(self._dirs))
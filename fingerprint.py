@@ -0,0 +1,88 @@
+import os
+import hashlib
+import logging
+
+
+# How the input files of a task are taken into account in its fingerprint.
+MODES = ('none', 'stat', 'content')
+# Files a command writes next to its inputs can't be told from them unless
+# they are declared (__OUTPUTS__): they would change the fingerprint of the
+# task at each execution. Input files are only looked at on demand.
+DEFAULT_MODE = 'none'
+
+# Size of the blocks read when hashing the content of a file.
+BLOCK_SIZE = 2**20
+
+
+class FingerprintError(Exception):
+    pass
+
+
+class Fingerprinter():
+    """
+    Compute the fingerprint of a task: a hash of its command, of the files
+    matching its scope value and of the fingerprints of the tasks it
+    depends on, so a change upstream changes the fingerprints of all the
+    tasks downstream.
+
+    Files are taken into account by their size and modification time in the
+    'stat' mode, by a hash of their content in the 'content' mode (hashed
+    once per run for files shared by several tasks). In the 'none' mode
+    fingerprints are empty: tasks are only skipped on their last status.
+    """
+    _mode = None
+    _content_hashes = None
+
+    def __init__(self, mode=DEFAULT_MODE):
+        if mode not in MODES:
+            logging.critical("Unknown fingerprint mode '%s', must be in %s",
+                             mode, MODES)
+            raise FingerprintError(mode)
+        self._mode = mode
+        self._content_hashes = dict()
+
+    @property
+    def mode(self):
+        return self._mode
+
+    def fingerprint(self, cmd, files, dependencies=()):
+        """
+        'cmd' is the command (a list of strings), 'files' the input files
+        and 'dependencies' the fingerprints of the tasks it depends on.
+        """
+        if self._mode == 'none':
+            return ""
+        h = hashlib.sha1()
+        h.update("\0".join(cmd).encode('utf-8', 'surrogateescape'))
+        for f in files:
+            h.update(b"\1")
+            h.update(str(f).encode('utf-8', 'surrogateescape'))
+            h.update(self._signature(f))
+        for dependency in dependencies:
+            h.update(b"\2")
+            h.update(dependency.encode())
+        return h.hexdigest()
+
+    def _signature(self, f):
+        try:
+            st = os.stat(f)
+        except OSError:
+            return b"missing"
+        signature = "{}:{}".format(st.st_size, st.st_mtime_ns).encode()
+        if self._mode == 'stat':
+            return signature
+        key = (str(f), signature)
+        try:
+            return self._content_hashes[key]
+        except KeyError:
+            pass
+        h = hashlib.sha1()
+        try:
+            with open(f, 'rb') as stream:
+                for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+                    h.update(block)
+        except OSError:
+            return b"unreadable"
+        digest = h.digest()
+        self._content_hashes[key] = digest
+        return digest
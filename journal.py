@@ -0,0 +1,222 @@
+import json
+import logging
+import datetime
+from collections import OrderedDict
+import settings
+from yaml_io import YamlIO
+from yaml_io import Literal
+
+
+# Fields of a status holding a datetime.
+DATE_FIELDS = ("execution_date", "start_date", "end_date")
+
+# The journal is compacted into the snapshot when it holds more records
+# than this and than scope values in the snapshot, so the total cost of
+# compactions stays linear in the number of records.
+COMPACT_MIN_RECORDS = 256
+
+
+class JournalError(Exception):
+    pass
+
+
+class NodeJournal():
+    """
+    Statuses of the scope values of a node, as a yaml snapshot (the .nexec
+    file) plus an append-only journal of the statuses recorded since.
+
+    Recording a status appends one json line to the journal and flushes it,
+    instead of dumping again all the statuses (and their outputs): it
+    survives a crash of presto and costs the size of the status only. A
+    truncated last line (presto killed while writing it) is ignored, and
+    removed when the journal is loaded to be appended again. Any other
+    unreadable line is an error.
+
+    From time to time, and when the node is done, the journal is compacted:
+    it is sealed (renamed with a generation number, a new journal is
+    started) and all the statuses are dumped in the snapshot, possibly by
+    YamlIO's background writer. Sealed journals are removed once the
+    snapshot is written, until then they are replayed too.
+    """
+    _snapshot_filename = None
+    _journal_filename = None
+    _statuses = None
+    _stream = None
+    _records = 0
+
+    def __init__(self, snapshot_filename):
+        self._snapshot_filename = snapshot_filename
+        self._journal_filename = (snapshot_filename.stripext() +
+                                  settings.NODE_JOURNAL_SUFFIX)
+        self._statuses = dict()
+
+    @staticmethod
+    def snapshot_filename_of(node_name):
+        """
+        The snapshot of the statuses of a node, in the presto directory.
+        """
+        return settings.PRESTO_DIR.joinpath(node_name +
+                                            settings.NODE_EXEC_SUFFIX)
+
+    @property
+    def journal_filename(self):
+        return self._journal_filename
+
+    def load(self):
+        """
+        Return the statuses of the last execution: the snapshot updated by
+        the journal, as a dictionary keyed by scope values.
+        """
+        statuses = dict()
+        if self._snapshot_filename.exists():
+            statuses = YamlIO.load_yaml(self._snapshot_filename) or dict()
+        for journal in self._journals():
+            self._truncate_partial_record(journal)
+        self._records = 0
+        for scope_value, status in self._replay():
+            statuses[scope_value] = status
+            self._records += 1
+        self._statuses = statuses
+        return dict(statuses)
+
+    def _sealed(self):
+        """
+        Sorted list of (generation, filename) of the sealed journals.
+        """
+        sealed = []
+        prefix = self._journal_filename.name + "."
+        for f in self._journal_filename.parent.files(prefix + "*"):
+            try:
+                sealed.append((int(f.name[len(prefix):]), f))
+            except ValueError:
+                continue
+        return sorted(sealed)
+
+    def recorded(self):
+        """
+        Yield the (scope value, status) recorded in the journals since the
+        snapshot, oldest first.
+        """
+        return self._replay()
+
+    def _journals(self):
+        """
+        The sealed journals then the journal, oldest first.
+        """
+        journals = [f for _, f in self._sealed()]
+        if self._journal_filename.exists():
+            journals.append(self._journal_filename)
+        return journals
+
+    def _replay(self):
+        for journal in self._journals():
+            with open(journal, 'r', encoding='utf-8') as stream:
+                for number, line in enumerate(stream, 1):
+                    if not line.endswith("\n"):
+                        # only the last line can lack its end of line.
+                        logging.warning("Ignoring truncated record in %s",
+                                        journal)
+                        continue
+                    try:
+                        scope_value, status = json.loads(line)
+                    except ValueError:
+                        logging.critical("Corrupted record line %s of %s",
+                                         number, journal)
+                        raise JournalError(journal)
+                    yield scope_value, self._from_record(status)
+
+    @staticmethod
+    def _truncate_partial_record(journal):
+        """
+        Remove the truncated record ending a journal, if any, so the next
+        records aren't appended to it.
+        """
+        with open(journal, 'rb+') as stream:
+            size = stream.seek(0, 2)
+            if size == 0:
+                return
+            stream.seek(size - 1)
+            if stream.read(1) == b"\n":
+                return
+            # read back from the end up to the previous end of line.
+            end = size
+            while end > 0:
+                start = max(0, end - 2**16)
+                stream.seek(start)
+                block = stream.read(end - start)
+                i = block.rfind(b"\n")
+                if i >= 0:
+                    end = start + i + 1
+                    break
+                end = start
+            logging.warning("Removing truncated record at the end of %s",
+                            journal)
+            stream.truncate(end)
+
+    def append(self, scope_value, status):
+        """
+        Record the status of a scope value.
+        """
+        self._statuses[scope_value] = status
+        if self._stream is None:
+            self._stream = open(self._journal_filename, 'a',
+                                encoding='utf-8')
+        self._stream.write(json.dumps([scope_value, self._to_record(status)],
+                                      ensure_ascii=False) + "\n")
+        self._stream.flush()
+        self._records += 1
+        if self._records >= max(COMPACT_MIN_RECORDS, len(self._statuses)):
+            self.compact()
+
+    def compact(self):
+        """
+        Dump all the statuses in the snapshot and empty the journal.
+        """
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        generation = None
+        if self._journal_filename.exists():
+            sealed = self._sealed()
+            generation = sealed[-1][0] + 1 if sealed else 0
+            self._journal_filename.rename(
+                self._journal_filename + "." + str(generation))
+        self._records = 0
+
+        def remove_sealed():
+            # A crash before this only replays records already in the
+            # snapshot.
+            for g, f in self._sealed():
+                if g <= generation:
+                    f.remove_p()
+        YamlIO.dump_yaml_later(dict(self._statuses), self._snapshot_filename,
+                               None if generation is None else remove_sealed)
+
+    def close(self):
+        """
+        Compact the journal and wait for the snapshot to be written.
+        """
+        if self._records or not self._snapshot_filename.exists():
+            self.compact()
+        elif self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        YamlIO.flush()
+
+    @staticmethod
+    def _to_record(status):
+        record = dict(status)
+        for field in DATE_FIELDS:
+            if isinstance(record.get(field), datetime.datetime):
+                record[field] = record[field].isoformat()
+        return record
+
+    @staticmethod
+    def _from_record(record):
+        status = OrderedDict(record)
+        for field in DATE_FIELDS:
+            if status.get(field):
+                status[field] = datetime.datetime.fromisoformat(status[field])
+        if "message" in status:
+            status["message"] = Literal(status["message"])
+        return status
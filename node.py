@@ -14,12 +14,15 @@ class Node():
     _workers_modifier = None
     _parents = None
     _cmd_for_value = None
+    _outputs = None
+    _outputs_for_value = None
 
     def __init__(self, yaml_doc):
         # initialise mutable attributs
         self._parents = set()
         self._parents.add(ROOT_NAME)
         self._cmd_for_value = dict()
+        self._outputs_for_value = dict()
 
         from data_model import DataModel
         from evaluator import Evaluator
@@ -86,14 +89,22 @@ class Node():
             logging.error("__WORKERS_MODIFIER__ must be castable "
                           "in float")
             raise
+        # Optional files produced by the command of each scope value.
+        self._outputs = yaml_doc.get('__OUTPUTS__') or list()
+        if isinstance(self._outputs, str):
+            self._outputs = [self._outputs]
         self._scope = DataModel.scopes[scope_name]
 
         # check integrity of the node.
+        # Commands are materialized once here for every scope value, the
+        # executor (and print mode) reuse them through cmd_for_value().
         for scope_value in self._scope.values:
             evaluator = Evaluator(cur_scope_value=scope_value)
             try:
                 self._cmd_for_value[scope_value] = [evaluator.evaluate(arg)
                                                     for arg in self._cmd]
+                self._outputs_for_value[scope_value] = [
+                    evaluator.evaluate(output) for output in self._outputs]
             except (TypeError, KeyError):
                 logging.critical("Error in node {}.".format(self._name))
                 raise
@@ -131,6 +142,29 @@ class Node():
     def cmd(self):
         return self._cmd
 
+    def cmd_for_value(self, scope_value):
+        """
+        The command (list of evaluated arguments) to launch for the given
+        scope value.
+        """
+        try:
+            return self._cmd_for_value[scope_value]
+        except KeyError:
+            logging.error("No command for scope value '%s' in node %s",
+                          scope_value, self._name)
+            raise
+
+    @property
+    def outputs(self):
+        return self._outputs
+
+    def outputs_for_value(self, scope_value):
+        """
+        The files (evaluated __OUTPUTS__) produced for the given scope
+        value, an empty list if the node doesn't declare any.
+        """
+        return self._outputs_for_value.get(scope_value, [])
+
     @property
     def workers_modifier(self):
         return self._workers_modifier
@@ -152,6 +186,8 @@ class Root(Node):
         self._workers_modifier = 1
         self._cmd = list()
         self._cmd_for_value = dict()
+        self._outputs = list()
+        self._outputs_for_value = dict()
 
     def __str__(self):
         return ("[--\nname: {0},"
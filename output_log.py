@@ -0,0 +1,93 @@
+import os
+import re
+import sys
+import gzip
+import hashlib
+import settings
+
+
+_UNSAFE_CHARS = re.compile(r'[^\w.-]+')
+
+
+def log_filename(node_name, scope_value):
+    """
+    The log file of the output of a scope value's command, in the logs
+    directory of the node: a readable end of the scope value and a hash
+    of it, so the name is unique and never too long.
+    """
+    digest = hashlib.sha1(scope_value.encode('utf-8',
+                                             'surrogateescape')).hexdigest()
+    readable = _UNSAFE_CHARS.sub('_', scope_value).strip('_')[-64:]
+    name = readable + "-" + digest[:12] + settings.LOG_SUFFIX
+    if settings.COMPRESS_LOGS:
+        name += ".gz"
+    return settings.PRESTO_DIR.joinpath(settings.LOGS_DIRNAME, node_name,
+                                        name)
+
+
+class OutputLog():
+    """
+    Write the output of a command to its log file (gzip compressed if
+    settings.COMPRESS_LOGS) as it comes, only keeping its size and its last
+    settings.OUTPUT_TAIL_SIZE bytes in memory.
+    """
+    _filename = None
+    _stream = None
+    _size = 0
+    _tail = None
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._tail = bytearray()
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        if filename.endswith(".gz"):
+            self._stream = gzip.open(filename, 'wb')
+        else:
+            self._stream = open(filename, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def size(self):
+        """
+        Number of bytes of the output (uncompressed).
+        """
+        return self._size
+
+    def write(self, data):
+        self._stream.write(data)
+        self._size += len(data)
+        self._tail += data
+        excess = len(self._tail) - settings.OUTPUT_TAIL_SIZE
+        if excess > 0:
+            del self._tail[:excess]
+
+    def copy(self, stream, chunk_size=2**16):
+        """
+        Write all what can be read from a binary stream.
+        """
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            self.write(chunk)
+
+    def close(self):
+        self._stream.close()
+
+    def tail(self):
+        """
+        The last lines of the output as a string, starting with '[...]' if
+        it has been truncated.
+        """
+        tail = bytes(self._tail)
+        if self._size > len(tail):
+            # Drop the first line, which is most likely partial.
+            tail = b"[...]\n" + tail[tail.find(b"\n") + 1:]
+        # same encoding than the one used to print the outputs
+        return tail.decode(sys.stdout.encoding or 'utf-8', 'replace')
@@ -5,6 +5,7 @@ import networkx as nx
 from settings import FAIL, ENDCBOLD, PRESTO_GRAPH_FILENAME, BOLD, ENDC
 
 from node import Root
+from profiling import Profiling
 
 
 class PipelineError(Exception):
@@ -29,12 +30,16 @@ class Pipeline():
         self._nodes = {self._root.name: self._root}
         self._graph.add_node(self._root.name)
         # build graph
-        self._build_nodes_from_documents(yaml_documents)
-        self._build_edges()
-        if self._cycle_detection():
+        with Profiling.phase("nodes"):
+            self._build_nodes_from_documents(yaml_documents)
+        with Profiling.phase("graph"):
+            self._build_edges()
+            has_cycle = self._cycle_detection()
+        if has_cycle:
             raise PipelineCyclicError()  # TODO what would be relevant here?
         # refine graph
-        self._thin()
+        with Profiling.phase("thin"):
+            self._thin()
         if self._check_nodes_parents():
             raise PipelineDependenceError()
 
@@ -126,7 +131,8 @@ class Pipeline():
 
         """
         for n in self._graph.nodes():
-            for cur_p in self._graph.predecessors(n):
+            # edges are removed while iterating.
+            for cur_p in list(self._graph.predecessors(n)):
                 for p in self._graph.predecessors(n):
                     if cur_p is p:
                         continue
@@ -150,8 +156,9 @@ class Pipeline():
     def walk(self, node):
             # TODO there must have a better way to do it.
             # yield node
-        for n in nx.topological_sort(self._graph,
-                                     nx.descendants(self._graph, node.name)):
+        descendants = self._graph.subgraph(
+            nx.descendants(self._graph, node.name))
+        for n in nx.topological_sort(descendants):
             yield self._nodes[n]
 
     @property
@@ -5,13 +5,23 @@
 Usage:
     presto [-l <log_level> | --log <log_level>]
            [-w <workers> | --workers <workers>]
+           [-e <executor> | --executor <executor>]
            [-p | --print]
            [-d | --display]
+           [-t | --tree]
            [-f | --force]
+           [--fingerprint <mode>]
+           [--store]
+           [--gzip-logs]
+           [--write-interval <seconds>]
+           [--rescan]
+           [--walk-workers <walk_workers>]
+           [--prune]
+           [--profile] [--cprofile <file>] [--stacks <file>]
            [-n <node_name> | --node <node_name>]
            [-s <name:regexp> | --override_scope <name:regexp>]...
            <pipe.yaml>
-    presto [-r | --report]
+    presto [-r | --report] [--json]
            <pipe.yaml>
     presto -h | --help
     presto -v |--version
@@ -20,6 +30,18 @@ Options:
     -w --workers <workers>
         Max number of different processus to launch together.
         [default: 0] -> Number of host's CPU.
+    -e --executor <executor>
+        How the commands are scheduled, in ['threaded', 'async', 'parallel',
+        'dag'].
+        threaded: node by node, each node waits for all the scope values of
+        its parents.
+        async: like threaded, with asyncio subprocesses launched from one
+        thread, for a lot of I/O bound commands.
+        parallel: like threaded, but the nodes whose parents are done run
+        together, sharing the <workers>.
+        dag: scope value by scope value, a command starts as soon as the
+        commands it depends on in the parent nodes are done.
+        [default: threaded]
     -l --log <log_level>
         Level of verbosity to print in the log file.
         Must be in ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
@@ -28,8 +50,57 @@ Options:
         Print the execution of the pipeline only.
     -d --display
         display a representation of the pipeline.
+    -t --tree
+        display the tree of the scope values containing each other.
     -f --force
         Force execution of any node of the pipeline.
+    --fingerprint <mode>
+        How a previous success is found outdated, in ['none', 'stat',
+        'content']. The command, the files matching the scope value (their
+        size and modification time with 'stat', their content with
+        'content') and what it depends on upstream are compared to the
+        last execution. 'none' only looks at the last status.
+        The files written by the commands next to their inputs must be
+        declared in __OUTPUTS__ with 'stat' and 'content', otherwise they
+        are taken as inputs and the commands are launched again each time.
+        [default: none]
+    --gzip-logs
+        Compress the logs of the commands outputs in .presto/logs.
+    --write-interval <seconds>
+        Write the status files of the nodes from a background thread, at
+        most once per file every <seconds>. 0 writes them right away.
+        [default: 0]
+    --store
+        Also record every attempt in .presto/runs.sqlite, to query the
+        history of the runs. The last statuses of the nodes are still read
+        from their status files, which executions without --store update
+        too.
+    --rescan
+        Ignore the cached listing of __ROOT__ and walk it entirely.
+    --walk-workers <walk_workers>
+        Number of threads listing the directories of __ROOT__ together.
+        Raise it on networked file systems. [default: 1]
+    --prune
+        Only walk the directories of __ROOT__ that may hold a value of the
+        overridden scopes (of all scopes but __ROOT__ if none is
+        overridden). Expressions not starting with '^' are then taken as
+        relative to __ROOT__: '-s SUBJECT:subj_042/' only walks
+        __ROOT__/subj_042/.
+        The files of the skipped directories are then unknown to the whole
+        run, not only to the scopes: a node of scope __ROOT__ only gets
+        the walked files as inputs (for ?{} and fingerprints), so its
+        commands and up to date checks may differ from an unpruned run.
+    --profile
+        Print the wall time and the memory of each phase of the run (walk
+        of __ROOT__, scopes, nodes, graph, yaml dumps, execution...). The
+        wall times are always in presto.log.
+    --cprofile <file>
+        Profile the main thread with cProfile, the statistics are written in
+        <file> (see python's pstats module).
+    --stacks <file>
+        Sample the stacks of all the threads, the collapsed stacks (one
+        line per stack with its number of samples) are written in <file>
+        for flamegraph.pl.
     -n --node <node_name>
         Launch pipeline from this node
     -s --override_scope <name:regexp>
@@ -37,7 +108,12 @@ Options:
         a scope.
         Example '-s SCOPE_NAME:reg-exp'
     -r --report
-        Produce a report of the last execution of the pipeline.
+        Produce a report of the last execution of the pipeline: per node,
+        the number of scope values which succeeded, were up to date, failed
+        or were skipped (a parent failed), the failed scope values, the
+        durations of the commands and the slowest ones.
+    --json
+        Print the report as json.
     <pipe.yaml>
         A yaml file starting with the data structure and pipeline description
 
@@ -56,6 +132,7 @@ try:
     import sys
     from docopt import docopt
     from yaml_io import YamlIO
+    from profiling import Profiling
     from path import Path
 except ImportError:
     msg = (settings.BOLD +
@@ -67,15 +144,25 @@ except ImportError:
 
 
 def print_report(arguments):
-    # First list all the .yaml file in the .presto dir.
-    # Then sort them by modification date, so report will be printed
-    # the same order than the pipeline has been executed.
+    import report
+    if not settings.PRESTO_DIR.isdir():
+        print("No execution of the pipeline found in", settings.PRESTO_DIR)
+        return
+    # nodes are reported in the order they have been executed.
+    reports = report.build_report()
+    if arguments['--json']:
+        print(report.report_json(reports))
+    else:
+        print(report.report_table(reports))
+
 
-    node_executions = settings.PRESTO_DIR.files()
-    # only keep node executions.
-    node_executions = [x for x in node_executions
-                       if x.ext == settings.NODE_EXEC_SUFFIX]
-    node_executions.sort(key=lambda x: x.mtime)
+def print_scope_tree():
+    from data_model import DataModel
+    tree = DataModel.scope_tree
+    for depth, value in tree.walk():
+        print("    " * depth + settings.BOLD +
+              DataModel.literal_of(value) + settings.ENDC +
+              " [" + ", ".join(tree.scopes_of(value)) + "]")
 
 
 def execute_pipeline(arguments):
@@ -123,8 +210,27 @@ def execute_pipeline(arguments):
     # construct data model
     # ##########################################################################
 
+    settings.USE_FILE_SNAPSHOT = not arguments['--rescan']
+    try:
+        settings.WALK_WORKERS = int(arguments['--walk-workers'])
+        assert settings.WALK_WORKERS > 0
+    except (ValueError, AssertionError):
+        logging.warning("<walk_workers> must be a strictly positive "
+                        "integer.\nDefault value (1) will be used.\n")
+        settings.WALK_WORKERS = 1
+    settings.PRUNE_WALK = arguments['--prune']
+    settings.COMPRESS_LOGS = arguments['--gzip-logs']
+    try:
+        write_interval = float(arguments['--write-interval'])
+        assert write_interval >= 0
+    except (ValueError, AssertionError):
+        logging.warning("<seconds> must be a positive number.\nDefault "
+                        "value (0) will be used.\n")
+        write_interval = 0
+
     yaml_document_path = Path(arguments['<pipe.yaml>']).abspath()
-    yaml_document = YamlIO.load_all_yaml(yaml_document_path)
+    with Profiling.phase("pipeline file"):
+        yaml_document = YamlIO.load_all_yaml(yaml_document_path)
 
     scope_to_override = {}
     for s in set(arguments['--override_scope']):
@@ -147,6 +253,10 @@ def execute_pipeline(arguments):
         logging.critical("empty <pipe.yaml> file.")
         sys.exit(1)
 
+    if arguments['--tree']:
+        print_scope_tree()
+        sys.exit()
+
     # ##########################################################################
     # construct pipeline
     # ##########################################################################
@@ -165,11 +275,45 @@ def execute_pipeline(arguments):
     # ##########################################################################
     # execute pipeline
     # ##########################################################################
-    from executor import ThreadedPipelineExecutor
-    executor = ThreadedPipelineExecutor(pipe, max_workers)
+    from executor import (ThreadedPipelineExecutor,
+                          AsyncPipelineExecutor,
+                          ParallelPipelineExecutor,
+                          DagPipelineExecutor)
+    executors = {'threaded': ThreadedPipelineExecutor,
+                 'async': AsyncPipelineExecutor,
+                 'parallel': ParallelPipelineExecutor,
+                 'dag': DagPipelineExecutor}
+    try:
+        executor_class = executors[arguments['--executor']]
+    except KeyError:
+        logging.warning("<executor> must be in %s.\nDefault value "
+                        "(threaded) will be used.\n", sorted(executors))
+        executor_class = ThreadedPipelineExecutor
+    executor = executor_class(pipe, max_workers)
     executor.print_only = arguments['--print']
     executor.force_execution = arguments['--force']
-    executor.execute(arguments['--node'])
+    from fingerprint import (Fingerprinter, FingerprintError, MODES,
+                             DEFAULT_MODE)
+    try:
+        executor.fingerprinter = Fingerprinter(arguments['--fingerprint'])
+    except FingerprintError:
+        logging.warning("<mode> must be in %s.\nDefault value (%s) will "
+                        "be used.\n", MODES, DEFAULT_MODE)
+        executor.fingerprinter = Fingerprinter(DEFAULT_MODE)
+    if arguments['--store'] and not arguments['--print']:
+        from run_store import RunStore
+        executor.run_store = RunStore(settings.RUN_STORE_FILENAME)
+        executor.run_store.start_run(str(yaml_document_path))
+    if write_interval:
+        YamlIO.start_writer(write_interval)
+    try:
+        with Profiling.phase("execution"):
+            executor.execute(arguments['--node'])
+    finally:
+        # Even when interrupted, write what is pending.
+        YamlIO.stop_writer()
+        if executor.run_store is not None:
+            executor.run_store.close()
 
 
 def main(arguments):
@@ -179,11 +323,22 @@ def main(arguments):
     settings.PRESTO_DIR = settings.PIPELINE_FILENAME.joinpath('.presto')
     settings.PRESTO_LOG_FILENAME = settings.PRESTO_DIR.joinpath('presto.log')
     settings.PRESTO_GRAPH_FILENAME = settings.PRESTO_DIR.joinpath('graph.png')
+    settings.RUN_STORE_FILENAME = settings.PRESTO_DIR.joinpath('runs.sqlite')
+    settings.YAML_CACHE_DIR = settings.PRESTO_DIR.joinpath('yaml_cache')
 
     if arguments['--report']:
         print_report(arguments)
-    else:
+        return
+    Profiling.start(trace_memory=arguments['--profile'],
+                    profile=bool(arguments['--cprofile']),
+                    sample=bool(arguments['--stacks']))
+    try:
         execute_pipeline(arguments)
+    finally:
+        Profiling.stop(arguments['--cprofile'], arguments['--stacks'])
+        Profiling.log_summary()
+        if arguments['--profile']:
+            print(Profiling.summary())
 
 
 # -- Main
@@ -0,0 +1,208 @@
+import sys
+import time
+import cProfile
+import logging
+import threading
+import contextlib
+import tracemalloc
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    # not on windows: the max RSS is not reported.
+    resource = None
+
+
+# Seconds between two samples of the stacks of the threads.
+SAMPLE_INTERVAL = 0.005
+
+
+class Profiling():
+    """
+    Wall time of the phases of a run (walking the root, building the
+    scopes, the nodes...), logged at INFO level as each one ends.
+
+    Once started, the memory of each phase is measured too (allocated by the
+    phase and its peak, with tracemalloc) and the whole run can be profiled
+    with cProfile and a sampler of the stacks of all the threads.
+    """
+    # Protects _PHASES, phases like yaml dumps happen in several threads.
+    _LOCK = threading.Lock()
+    # {phase name: statistics}, in the order they started.
+    _PHASES = OrderedDict()
+    _trace_memory = False
+    _profile = None
+    _sampler = None
+
+    @classmethod
+    def start(cls, trace_memory=True, profile=False, sample=False):
+        """
+        Measure the memory of the phases ('trace_memory'), profile the
+        calls of the main thread ('profile') and sample the stacks of all
+        the threads ('sample').
+        """
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            cls._trace_memory = True
+        if profile:
+            cls._profile = cProfile.Profile()
+            cls._profile.enable()
+        if sample:
+            cls._sampler = StackSampler(SAMPLE_INTERVAL)
+
+    @classmethod
+    def stop(cls, profile_filename=None, stacks_filename=None):
+        """
+        Stop what start started, writing the cProfile statistics and the
+        collapsed stacks (one 'frame;frame;... count' line per stack, the
+        input of flamegraph.pl) in the given files.
+        """
+        if cls._profile is not None:
+            cls._profile.disable()
+            if profile_filename:
+                cls._profile.dump_stats(profile_filename)
+            cls._profile = None
+        if cls._sampler is not None:
+            cls._sampler.stop()
+            if stacks_filename:
+                cls._sampler.write(stacks_filename)
+            cls._sampler = None
+        if cls._trace_memory:
+            tracemalloc.stop()
+            cls._trace_memory = False
+
+    @classmethod
+    @contextlib.contextmanager
+    def phase(cls, name):
+        """
+        Time what is done in the 'with' block as part of the phase 'name'.
+        A phase can be entered several times (and from several threads),
+        its times are added up.
+        """
+        memory = None
+        if cls._trace_memory and threading.current_thread() is \
+                threading.main_thread():
+            # peaks of enclosing phases are lost, only the innermost is
+            # exact.
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with cls._LOCK:
+                stats = cls._PHASES.setdefault(name, dict(
+                    seconds=0., calls=0, allocated_MB=None, peak_MB=None))
+                stats["seconds"] += elapsed
+                stats["calls"] += 1
+                if memory is not None:
+                    current, peak = tracemalloc.get_traced_memory()
+                    stats["allocated_MB"] = ((stats["allocated_MB"] or 0) +
+                                             (current - memory) / 2**20)
+                    stats["peak_MB"] = max(stats["peak_MB"] or 0,
+                                           (peak - memory) / 2**20)
+            if stats["calls"] == 1:
+                rss = max_rss_mb()
+                if rss is None:
+                    logging.info("Phase '%s' done in %.3f s", name, elapsed)
+                else:
+                    logging.info("Phase '%s' done in %.3f s (max RSS %d MB)",
+                                 name, elapsed, rss)
+
+    @classmethod
+    def phases(cls):
+        with cls._LOCK:
+            return OrderedDict((name, dict(stats))
+                               for name, stats in cls._PHASES.items())
+
+    @classmethod
+    def log_summary(cls):
+        """
+        Log the phases entered several times, their first time only has
+        been logged.
+        """
+        for name, stats in cls.phases().items():
+            if stats["calls"] > 1:
+                logging.info("Phase '%s': %d times, %.3f s in total", name,
+                             stats["calls"], stats["seconds"])
+
+    @classmethod
+    def summary(cls):
+        """
+        The phases as a table to print.
+        """
+        lines = ["{0:<24} {1:>10} {2:>7} {3:>14} {4:>9}".format(
+            "phase", "seconds", "calls", "allocated (MB)", "peak (MB)")]
+        for name, stats in cls.phases().items():
+            lines.append("{0:<24} {1:>10.3f} {2:>7} {3:>14} {4:>9}".format(
+                name, stats["seconds"], stats["calls"],
+                _format_mb(stats["allocated_MB"]),
+                _format_mb(stats["peak_MB"])))
+        rss = max_rss_mb()
+        if rss is not None:
+            lines.append("max RSS: {} MB".format(rss))
+        return "\n".join(lines)
+
+
+def _format_mb(value):
+    return "-" if value is None else "{:.1f}".format(value)
+
+
+def max_rss_mb():
+    """
+    Max resident set size of presto in MB, None if it can't be known on
+    this platform.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+class StackSampler():
+    """
+    A thread sampling the stacks of all the other threads every 'interval'
+    seconds, counting the samples of each stack.
+    """
+    _interval = None
+    _counts = None
+    _stopped = None
+    _thread = None
+
+    def __init__(self, interval):
+        self._interval = interval
+        self._counts = dict()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        names = dict()
+        while not self._stopped.wait(self._interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == self._thread.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{0} ({1}:{2})".format(
+                        code.co_name, code.co_filename.rsplit("/", 1)[-1],
+                        code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self._counts[key] = self._counts.get(key, 0) + 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def write(self, filename):
+        with open(filename, 'w') as stream:
+            for stack, count in sorted(self._counts.items()):
+                stream.write("{0} {1}\n".format(stack, count))
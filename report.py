@@ -0,0 +1,290 @@
+import os
+import re
+import json
+import mmap
+import itertools
+import heapq
+import logging
+import settings
+from journal import NodeJournal
+from yaml_io import YamlIO
+from executor import percentile
+
+
+# Number of slowest tasks reported, per node and for the whole pipeline.
+SLOWEST_TASKS = 10
+
+# Fields of the statuses the report needs, the others (the outputs first)
+# are never kept in memory.
+REPORT_FIELDS = ("status", "context", "duration")
+
+# Contexts of a success without a command launched by the last execution.
+NOT_EXECUTED = ("NO_WORK_TO_DO", "UP_TO_DATE")
+
+# The lines of a snapshot the report needs, as written by the yaml dumper:
+# the scope values (plain scalar keys of the top level mapping) and the
+# fields of REPORT_FIELDS of their statuses. Any other line at the top level
+# is a layout the scan doesn't understand. Lines are matched from their
+# preceding new line, a literal the regular expression engine looks for
+# much faster than the start of a line.
+_SNAPSHOT_LINE = re.compile(
+    rb'\n(?:([^\s\'"?&*!|>%@`#{\[,-][^#\n]*):'
+    rb'|  (' + "|".join(REPORT_FIELDS).encode() + rb'): (.*)'
+    rb'|(\S.*))$', re.M)
+
+
+class UnexpectedSyntax(Exception):
+    pass
+
+
+def scan_snapshot(filename):
+    """
+    Yield (scope value, {field: value}) for the fields of REPORT_FIELDS of
+    the statuses of a snapshot (a .nexec file), without parsing the
+    outputs.
+
+    Only the layout written by YamlIO.dump_yaml is understood, anything
+    else raises UnexpectedSyntax.
+    """
+    scope_value = None
+    fields = None
+    scalars = dict()
+    with open(filename, 'rb') as stream:
+        if os.fstat(stream.fileno()).st_size == 0:
+            return
+        # the lines not needed (the outputs) are skipped by the regular
+        # expression, without being read line by line in python.
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end_of_first_line = data.find(b"\n")
+            if end_of_first_line < 0:
+                end_of_first_line = len(data)
+            first_line = _SNAPSHOT_LINE.match(b"\n" +
+                                              data[:end_of_first_line])
+            for match in itertools.chain(
+                    [first_line],
+                    _SNAPSHOT_LINE.finditer(data, end_of_first_line)):
+                if match is None:
+                    # the first line is empty or indented
+                    raise UnexpectedSyntax(data[:end_of_first_line])
+                key, name, value, unexpected = match.groups()
+                if unexpected is not None:
+                    raise UnexpectedSyntax(unexpected.decode('utf-8',
+                                                             'replace'))
+                if key is not None:
+                    if scope_value is not None:
+                        yield scope_value, fields
+                    scope_value = key.decode('utf-8')
+                    fields = dict()
+                elif fields is None:
+                    raise UnexpectedSyntax(match.group(0))
+                elif name == b"duration":
+                    try:
+                        fields["duration"] = float(value)
+                    except ValueError:
+                        fields["duration"] = _scalar(value)
+                else:
+                    # few different statuses and contexts: decoded once.
+                    try:
+                        fields[name.decode()] = scalars[value]
+                    except KeyError:
+                        scalars[value] = _scalar(value)
+                        fields[name.decode()] = scalars[value]
+    if scope_value is not None:
+        yield scope_value, fields
+
+
+def _scalar(value):
+    value = value.decode('utf-8')
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    if value[:1] in ('"', "&", "*", "!", "[", "{", "|", ">"):
+        raise UnexpectedSyntax(value)
+    return value
+
+
+def node_statuses(node_name):
+    """
+    The fields of REPORT_FIELDS of the last status of each scope value of
+    a node, as a dictionary keyed by scope values: the snapshot updated by
+    the journal, as loaded by the executor. The run store, which only knows
+    the runs made with it, is not read.
+    """
+    snapshot = NodeJournal.snapshot_filename_of(node_name)
+    statuses = dict()
+    if snapshot.exists():
+        try:
+            for scope_value, fields in scan_snapshot(snapshot):
+                statuses[scope_value] = fields
+        except UnexpectedSyntax:
+            logging.debug("Parsing the whole yaml document of %s", snapshot)
+            statuses = dict()
+            for scope_value, status in (YamlIO.load_yaml(snapshot) or
+                                        dict()).items():
+                statuses[scope_value] = {f: status.get(f)
+                                         for f in REPORT_FIELDS}
+    for scope_value, status in NodeJournal(snapshot).recorded():
+        statuses[scope_value] = {f: status.get(f) for f in REPORT_FIELDS}
+    return statuses
+
+
+def executed_nodes():
+    """
+    Names of the nodes having statuses in the presto directory, in the
+    order they have been executed (from the modification dates).
+    """
+    last_modification = dict()
+    for f in settings.PRESTO_DIR.files():
+        name = f.name
+        if name.endswith(settings.NODE_EXEC_SUFFIX):
+            name = name[:-len(settings.NODE_EXEC_SUFFIX)]
+        elif settings.NODE_JOURNAL_SUFFIX in name:
+            # the journal, or a sealed one (.njournal.<generation>)
+            name = name[:name.index(settings.NODE_JOURNAL_SUFFIX)]
+        else:
+            continue
+        last_modification[name] = max(last_modification.get(name, 0),
+                                      f.mtime)
+    return sorted(last_modification, key=last_modification.get)
+
+
+class NodeReport():
+    """
+    Counts, failed scope values and durations of the last statuses of a
+    node.
+    """
+    _name = None
+    _counts = None
+    _failed = None
+    _durations = None
+    _slowest = None
+
+    def __init__(self, name):
+        self._name = name
+        self._counts = dict(success=0, up_to_date=0, failure=0, skipped=0)
+        self._failed = []
+        self._durations = []
+        # min heap of the (duration, scope value) of the slowest tasks
+        self._slowest = []
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def counts(self):
+        return self._counts
+
+    @property
+    def failed(self):
+        return self._failed
+
+    @property
+    def slowest(self):
+        return sorted(self._slowest, reverse=True)
+
+    def add(self, scope_value, status):
+        context = status.get("context")
+        if context == "PARENT_FAILED":
+            self._counts["skipped"] += 1
+            return
+        if status.get("status") == "SUCCESS":
+            if context in NOT_EXECUTED:
+                self._counts["up_to_date"] += 1
+                return
+            self._counts["success"] += 1
+        else:
+            self._counts["failure"] += 1
+            self._failed.append(scope_value)
+        duration = status.get("duration")
+        if isinstance(duration, (int, float)):
+            self._durations.append(duration)
+            if len(self._slowest) < SLOWEST_TASKS:
+                heapq.heappush(self._slowest, (duration, scope_value))
+            else:
+                heapq.heappushpop(self._slowest, (duration, scope_value))
+
+    def durations(self):
+        """
+        Statistics of the durations of the commands launched, None if
+        there is none.
+        """
+        if not self._durations:
+            return None
+        values = sorted(self._durations)
+        return {"p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "max": values[-1],
+                "total": sum(values)}
+
+    def to_dict(self):
+        d = dict(node=self._name)
+        d.update(self._counts)
+        d["failed"] = sorted(self._failed)
+        d["duration"] = self.durations()
+        d["slowest"] = [{"scope_value": v, "duration": t}
+                        for t, v in self.slowest]
+        return d
+
+
+def build_report():
+    """
+    List of the NodeReport of the executed nodes, in execution order.
+    """
+    reports = []
+    for node_name in executed_nodes():
+        report = NodeReport(node_name)
+        for scope_value, status in node_statuses(node_name).items():
+            report.add(scope_value, status)
+        reports.append(report)
+    return reports
+
+
+def slowest_tasks(reports):
+    """
+    The SLOWEST_TASKS slowest tasks of all the nodes, as a list of
+    (duration, node name, scope value).
+    """
+    return heapq.nlargest(SLOWEST_TASKS,
+                          ((t, r.name, v) for r in reports
+                           for t, v in r.slowest))
+
+
+def report_json(reports):
+    return json.dumps({"nodes": [r.to_dict() for r in reports],
+                       "slowest": [{"node": n, "scope_value": v,
+                                    "duration": t}
+                                   for t, n, v in slowest_tasks(reports)]},
+                      indent=2)
+
+
+def report_table(reports):
+    lines = []
+    header = ("{0:<30} {1:>9} {2:>10} {3:>9} {4:>9} {5:>10} {6:>10} "
+              "{7:>10}")
+    lines.append(settings.BOLD +
+                 header.format("node", "success", "up_to_date", "failure",
+                               "skipped", "p50 (s)", "p95 (s)", "max (s)") +
+                 settings.ENDC)
+    for r in reports:
+        durations = r.durations() or {}
+        line = header.format(
+            r.name[:30], r.counts["success"], r.counts["up_to_date"],
+            r.counts["failure"], r.counts["skipped"],
+            *("{:.2f}".format(durations[k]) if k in durations else "-"
+              for k in ("p50", "p95", "max")))
+        if r.failed:
+            line = settings.FAIL + line + settings.ENDC
+        lines.append(line)
+    for r in reports:
+        if r.failed:
+            lines.append("")
+            lines.append(settings.BOLD + "Failed scope values in " + r.name +
+                         settings.ENDC)
+            lines.extend("    " + v for v in sorted(r.failed))
+    slowest = slowest_tasks(reports)
+    if slowest:
+        lines.append("")
+        lines.append(settings.BOLD + "Slowest tasks" + settings.ENDC)
+        lines.extend("  {0:>10.2f}s  {1}  {2}".format(t, n, v)
+                     for t, n, v in slowest)
+    return "\n".join(lines)
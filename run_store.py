@@ -0,0 +1,177 @@
+import time
+import sqlite3
+import logging
+import datetime
+
+
+# Attempts are committed at least this often (in seconds) and each time a
+# node is done. The journal of the node stays the reference after a crash.
+COMMIT_INTERVAL = 1.0
+
+# Columns which weren't in the first version of the attempts table.
+ADDED_COLUMNS = (("log", "TEXT"), ("output_size", "INTEGER"),
+                 ("fingerprint", "TEXT"), ("start_date", "TEXT"),
+                 ("end_date", "TEXT"), ("user_time", "REAL"),
+                 ("system_time", "REAL"), ("max_rss_kb", "INTEGER"))
+
+# Fields of a status stored in the columns of the same name, in the order of
+# the statuses, 'message' is stored in the 'output' column.
+STATUS_COLUMNS = ("execution_date", "start_date", "end_date", "duration",
+                  "user_time", "system_time", "max_rss_kb", "status",
+                  "context", "cmd", "fingerprint", "log", "output_size")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    pipeline TEXT
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    run INTEGER NOT NULL REFERENCES runs(id),
+    node TEXT NOT NULL,
+    scope_value TEXT NOT NULL,
+    cmd TEXT,
+    status TEXT,
+    context TEXT,
+    execution_date TEXT,
+    duration REAL,
+    recorded REAL NOT NULL,
+    output TEXT,
+    log TEXT,
+    output_size INTEGER,
+    fingerprint TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    user_time REAL,
+    system_time REAL,
+    max_rss_kb INTEGER
+);
+-- columns added to the attempts of older stores, see RunStore._migrate
+CREATE INDEX IF NOT EXISTS attempts_node ON attempts(node, scope_value);
+CREATE INDEX IF NOT EXISTS attempts_status ON attempts(status, node);
+CREATE INDEX IF NOT EXISTS attempts_scope_value ON attempts(scope_value);
+CREATE INDEX IF NOT EXISTS attempts_run ON attempts(run, node, scope_value);
+"""
+
+
+class RunStoreError(Exception):
+    pass
+
+
+class RunStore():
+    """
+    Every attempt to execute a (node, scope value), from all the runs of a
+    pipeline, in a sqlite database.
+
+    It is a log of the attempts, indexed by node, status and scope value,
+    to query the history of the runs (the failed scope values of a run...).
+    It only knows the runs made with it, so it is never read to resume a
+    pipeline or to report its statuses: the statuses of the nodes (see
+    journal.NodeJournal) are the reference.
+    """
+    _filename = None
+    _connection = None
+    _run = None
+    _last_commit = 0
+
+    def __init__(self, filename):
+        self._filename = filename
+        try:
+            self._connection = sqlite3.connect(str(filename))
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+            self._migrate()
+        except sqlite3.Error as err:
+            logging.critical("Unable to open run store %s: %s", filename, err)
+            raise RunStoreError(err)
+
+    def _migrate(self):
+        columns = [row[1] for row in
+                   self._connection.execute("PRAGMA table_info(attempts)")]
+        for name, kind in ADDED_COLUMNS:
+            if name not in columns:
+                self._connection.execute(
+                    "ALTER TABLE attempts ADD COLUMN {} {}".format(name,
+                                                                   kind))
+        self._connection.commit()
+
+    @property
+    def run(self):
+        return self._run
+
+    def start_run(self, pipeline=None):
+        """
+        Start a new run, the attempts recorded from now are part of it.
+        """
+        cursor = self._connection.execute(
+            "INSERT INTO runs (started, pipeline) VALUES (?, ?)",
+            (datetime.datetime.now().isoformat(), pipeline))
+        self._connection.commit()
+        self._last_commit = time.monotonic()
+        self._run = cursor.lastrowid
+        return self._run
+
+    def record(self, node_name, scope_value, status):
+        """
+        Record an attempt from its status (see PipelineExecutor).
+        """
+        if self._run is None:
+            self.start_run()
+        values = []
+        for column in STATUS_COLUMNS:
+            value = status.get(column)
+            if isinstance(value, datetime.datetime):
+                value = value.isoformat()
+            # statuses use "" for unknown values
+            values.append(None if value == "" else value)
+        self._connection.execute(
+            "INSERT INTO attempts (run, node, scope_value, recorded, output, "
+            "{}) VALUES ({})".format(", ".join(STATUS_COLUMNS),
+                                     ", ".join("?" * (len(values) + 5))),
+            [self._run, node_name, scope_value, time.time(),
+             status.get("message")] + values)
+        if time.monotonic() - self._last_commit > COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self._connection.commit()
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        self._connection.close()
+
+    def failed(self, run=None):
+        """
+        List of (node, scope value) whose last attempt of the run (the
+        last run if None) failed.
+        """
+        if run is None:
+            run = self.last_run()
+        return self._connection.execute(
+            "SELECT node, scope_value FROM attempts WHERE id IN ("
+            "SELECT max(id) FROM attempts WHERE run = ? "
+            "GROUP BY node, scope_value) AND status = 'FAILURE' "
+            "ORDER BY node, scope_value", (run,)).fetchall()
+
+    def summary(self, run=None):
+        """
+        Dictionary {node: {status: number of scope values}} from the last
+        attempt of each scope value of the run (the last run if None).
+        """
+        if run is None:
+            run = self.last_run()
+        rows = self._connection.execute(
+            "SELECT node, status, count(*) FROM attempts WHERE id IN ("
+            "SELECT max(id) FROM attempts WHERE run = ? "
+            "GROUP BY node, scope_value) GROUP BY node, status", (run,))
+        summary = dict()
+        for node_name, status, count in rows:
+            summary.setdefault(node_name, dict())[status] = count
+        return summary
+
+    def last_run(self):
+        row = self._connection.execute("SELECT max(id) FROM runs").fetchone()
+        return row[0]
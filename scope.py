@@ -5,11 +5,27 @@ class Scope():
     name = None
     expression = None
     values = None
+    literals = None
+    _literal_of_value = None
 
-    def __init__(self, name, expression, values):
+    def __init__(self, name, expression, values, literals=None):
+        """
+        'values' are regular expressions matching the literal strings
+        'literals' (the raw parts of file paths they have been built from).
+        """
         self.name = name
         self.expression = expression
         self.values = values
+        if literals is None:
+            literals = list(values)
+        self.literals = literals
+        self._literal_of_value = dict(zip(values, literals))
+
+    def literal(self, value):
+        """
+        The raw literal string of one of the scope values.
+        """
+        return self._literal_of_value[value]
 
     def __str__(self):
         return ("name: {0}\nreg-exp: {1}\nvalues:\n{2}"
@@ -0,0 +1,230 @@
+import re
+import bisect
+import logging
+from array import array
+
+
+class ScopeIndexError(Exception):
+    pass
+
+
+def match_prefix(compiled, string):
+    """
+    Return what 're.search(r".*?" + expression, string).group(0)' would
+    return, using the compiled expression alone.
+
+    The lazy '.*?' prefix only extends the match of the expression back
+    to the beginning of the line it has been found on, so there is no
+    need to pay for its backtracking on every position of the string.
+    """
+    match = compiled.search(string)
+    if match is None:
+        return None
+    start = string.rfind('\n', 0, match.start()) + 1
+    return string[start:match.end()]
+
+
+def match_searched(compiled, string):
+    """
+    Return what 'compiled.search(string).group(0)' returns, for the
+    expressions compiled with their '.*?' prefix.
+    """
+    match = compiled.search(string)
+    if match is None:
+        return None
+    return match.group(0)
+
+
+def has_top_level_alternation(expression):
+    """
+    Tell if 'expression' has a '|' outside of any group or set: the '.*?'
+    prefix then only applies to its first alternative, match_prefix can't
+    be used.
+    """
+    depth = 0
+    i = 0
+    while i < len(expression):
+        c = expression[i]
+        if c == '\\':
+            i += 1
+        elif c == '[':
+            # a ']' first in a set (after an optional '^') is a literal.
+            i += 1
+            if expression[i:i + 1] == '^':
+                i += 1
+            if expression[i:i + 1] == ']':
+                i += 1
+            while i < len(expression) and expression[i] != ']':
+                if expression[i] == '\\':
+                    i += 1
+                i += 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+class ScopeIndex():
+    """
+    Index the files of the data model against all the scopes at once.
+
+    Every scope expression is compiled a single time and the file list is
+    walked a single time, filling together the values of all the scopes
+    and a mapping between each file and the scope values it belongs to.
+
+    As a scope value is a prefix of the files it has been found in, the
+    files matching it are a contiguous range of the sorted file list: these
+    ranges are computed once the walk is done.
+    """
+    _compiled = None
+    _matchers = None
+    _values = None
+    _value_ids = None
+    _files = None
+    _ranges = None
+    _literals = None
+
+    def __init__(self, expressions):
+        """
+        'expressions' is a dictionary, keys are scope names and values the
+        (already evaluated) regular expressions defining the scopes.
+        """
+        self._compiled = dict()
+        self._matchers = dict()
+        for name, expression in expressions.items():
+            try:
+                if has_top_level_alternation(expression):
+                    self._compiled[name] = re.compile(r".*?" + expression)
+                    self._matchers[name] = match_searched
+                else:
+                    self._compiled[name] = re.compile(expression)
+                    self._matchers[name] = match_prefix
+            except re.error:
+                logging.critical("bad regular expression '%s' for %s: ",
+                                 expression, name)
+                raise
+        # For each scope, the list of its values and an array giving for
+        # each file the position of its value in this list (-1 if none):
+        # a few bytes per file and per scope, even on huge roots.
+        self._values = {name: [] for name in self._compiled}
+        self._value_ids = {name: array('i') for name in self._compiled}
+        self._ranges = dict()
+        self._literals = dict()
+
+    def build(self, files, escape=None):
+        """
+        Walk 'files' once and find for each of them the value of every
+        scope it matches.
+        'escape' is applied to every value found before it is stored.
+        'files' must be sorted.
+        """
+        compiled = [(self._matchers[name], regexp, self._values[name],
+                     self._value_ids[name], dict())
+                    for name, regexp in self._compiled.items()]
+        cache = dict()
+        for f in files:
+            for matcher, regexp, values, value_ids, ids in compiled:
+                value = matcher(regexp, f)
+                if value is None:
+                    value_ids.append(-1)
+                    continue
+                if escape is not None:
+                    try:
+                        value = cache[value]
+                    except KeyError:
+                        value = cache.setdefault(value, escape(value))
+                try:
+                    value_ids.append(ids[value])
+                except KeyError:
+                    ids[value] = len(values)
+                    value_ids.append(len(values))
+                    values.append(value)
+        self._files = files
+        if escape is None:
+            cache = {value: value for values in self._values.values()
+                     for value in values}
+        for raw, value in cache.items():
+            self._ranges[value] = self.prefix_range(raw)
+            self._literals[value] = raw
+        return self
+
+    def prefix_range(self, prefix):
+        """
+        Bounds (lo, hi) of the files starting with 'prefix'.
+        """
+        lo = bisect.bisect_left(self._files, prefix)
+        # no path has a character above the last unicode code point.
+        hi = bisect.bisect_left(self._files, prefix + chr(0x10ffff), lo)
+        return (lo, hi)
+
+    def range_of(self, value):
+        """
+        Bounds (lo, hi) of the files matching the given scope value,
+        None if 'value' isn't a known scope value.
+        """
+        return self._ranges.get(value)
+
+    def files_of(self, value):
+        """
+        Sorted list of the files matching the given scope value,
+        None if 'value' isn't a known scope value.
+        """
+        if value == "":
+            return self._files
+        try:
+            lo, hi = self._ranges[value]
+        except KeyError:
+            return None
+        return self._files[lo:hi]
+
+    def files_with_prefix(self, prefix):
+        """
+        Sorted list of the files starting with the literal 'prefix'.
+        """
+        lo, hi = self.prefix_range(prefix)
+        return self._files[lo:hi]
+
+    def literal_of(self, value):
+        """
+        The raw string a scope value has been built from,
+        None if 'value' isn't a known scope value.
+        """
+        return self._literals.get(value)
+
+    def values(self, name):
+        """
+        Sorted list of all the values found for the scope 'name'.
+        """
+        try:
+            return sorted(self._values[name])
+        except KeyError:
+            raise ScopeIndexError("unknown scope '{}'".format(name))
+
+    def scope_values_at(self, index):
+        """
+        Dictionary {scope name: scope value} of the file at 'index' in the
+        sorted files.
+        """
+        scope_values = dict()
+        for name, value_ids in self._value_ids.items():
+            value_id = value_ids[index]
+            if value_id >= 0:
+                scope_values[name] = self._values[name][value_id]
+        return scope_values
+
+    def scope_values_of(self, f):
+        """
+        Dictionary {scope name: scope value} of the given file.
+        """
+        index = bisect.bisect_left(self._files, f)
+        if index == len(self._files) or self._files[index] != f:
+            raise KeyError(f)
+        return self.scope_values_at(index)
+
+    @property
+    def names(self):
+        return list(self._compiled.keys())
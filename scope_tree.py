@@ -0,0 +1,104 @@
+from pprint import pformat
+
+
+class ScopeTree():
+    """
+    Containment tree between the values of all the scopes.
+
+    A scope value is the prefix of the files it has been found in, so a
+    value contains another one when its literal is a prefix of the other's.
+    Values having the same literal in different scopes (e.g. SCOPE_2 and
+    SCOPE_2_DIGIT in tests_data) are one node of the tree.
+
+    For each value, the value containing it in every other scope is stored,
+    so redirections like ?{key->SCOPE} are a dictionary lookup.
+    """
+    _scopes_of = None
+    _ancestors = None
+    _parent = None
+    _children = None
+
+    def __init__(self, scope_index):
+        """
+        Build the tree from a built ScopeIndex.
+        """
+        self._scopes_of = dict()
+        self._ancestors = dict()
+        self._parent = dict()
+        self._children = dict()
+        names = scope_index.names
+        for name in names:
+            for value in scope_index.values(name):
+                self._scopes_of.setdefault(value, []).append(name)
+        for value in self._scopes_of:
+            literal = scope_index.literal_of(value)
+            # Every file of the value has the value's literal as prefix, the
+            # values of the first one which are prefixes of this literal
+            # are values containing it.
+            first_file, _ = scope_index.range_of(value)
+            ancestors = dict()
+            parent = None
+            parent_literal = ""
+            for name, other in scope_index.scope_values_at(first_file).items():
+                other_literal = scope_index.literal_of(other)
+                if not literal.startswith(other_literal):
+                    continue
+                ancestors[name] = other
+                if (other != value and
+                        len(other_literal) >= len(parent_literal)):
+                    parent = other
+                    parent_literal = other_literal
+            self._ancestors[value] = ancestors
+            self._parent[value] = parent
+            self._children.setdefault(value, [])
+            if parent is not None:
+                self._children.setdefault(parent, []).append(value)
+        for children in self._children.values():
+            children.sort()
+
+    def __str__(self):
+        return pformat(self._children)
+
+    def ancestor(self, value, scope_name):
+        """
+        The value of the scope 'scope_name' containing 'value' (or equal to
+        it), None if there is none or if 'value' isn't a scope value.
+        """
+        try:
+            return self._ancestors[value].get(scope_name)
+        except KeyError:
+            return None
+
+    def parent(self, value):
+        """
+        The closest value containing 'value', None for a top level value.
+        """
+        return self._parent[value]
+
+    def children(self, value):
+        """
+        Sorted list of the values whose parent is 'value'.
+        """
+        return self._children[value]
+
+    def scopes_of(self, value):
+        """
+        Names of the scopes having 'value' as one of their values.
+        """
+        return self._scopes_of[value]
+
+    def roots(self):
+        """
+        Sorted list of the top level values.
+        """
+        return sorted(v for v, p in self._parent.items() if p is None)
+
+    def walk(self, value=None, depth=0):
+        """
+        Yield (depth, value) for each value of the tree under 'value' (all
+        the tree if None), parents before their children.
+        """
+        values = self.roots() if value is None else self.children(value)
+        for v in values:
+            yield depth, v
+            yield from self.walk(v, depth + 1)
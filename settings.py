@@ -5,10 +5,27 @@ from path import Path
 PRESTO_DIR = Path('')
 PRESTO_LOG_FILENAME = Path('')
 PRESTO_GRAPH_FILENAME = Path('')
+RUN_STORE_FILENAME = Path('')
+YAML_CACHE_DIR = None
 
 # extention helpers:
 
 NODE_EXEC_SUFFIX = '.nexec'
+NODE_JOURNAL_SUFFIX = '.njournal'
+FILE_LISTING_SUFFIX = '.flist'
+LOG_SUFFIX = '.log'
+
+# outputs of the commands, set in presto.py
+
+LOGS_DIRNAME = 'logs'
+COMPRESS_LOGS = False
+OUTPUT_TAIL_SIZE = 4096
+
+# walk behaviour, set in presto.py
+
+USE_FILE_SNAPSHOT = True
+WALK_WORKERS = 1
+PRUNE_WALK = False
 
 # stdout color helpers
 
@@ -0,0 +1,96 @@
+import re
+import logging
+import settings
+
+
+STATIC_RE = re.compile(r"\$\{(.*?)\}")
+DYNAMIC_RE = re.compile(r"\?\{(.*?)\}")
+
+# Above this number of nested ${} substitutions, helpers are considered
+# to reference each other in a loop.
+MAX_STATIC_DEPTH = 64
+
+
+def expand_static(string, helpers):
+    """
+    Substitute all the ${key} of 'string' by the value of 'key' in helpers,
+    until no ${key} remains (values may themselves contain ${other_key}).
+    """
+    for _ in range(MAX_STATIC_DEPTH):
+        if "${" not in string:
+            return string
+        string = STATIC_RE.sub(lambda m: _helper(helpers, m.group(1)),
+                               string)
+    if STATIC_RE.search(string) is None:
+        return string
+    logging.error("Too many nested ${} in expression: '%s'\n"
+                  "Helpers are probably referencing each other.", string)
+    raise KeyError(string)
+
+
+def _helper(helpers, key):
+    try:
+        value = helpers[key]
+    except KeyError:
+        msg = ("unable to find any key " +
+               settings.FAIL + "{}".format(key) + settings.ENDCBOLD +
+               " in configuration file")
+        logging.critical(msg)
+        raise
+    if not isinstance(value, str):
+        msg = ("Value of key " + settings.FAIL + "{}".format(key) +
+               settings.ENDCBOLD + " is not of type String: "
+               "{}".format(value))
+        logging.error(msg)
+        raise TypeError(msg)
+    return value
+
+
+class Template():
+    """
+    A yaml string parsed once into literal parts and ?{key} placeholders.
+
+    All the ${key} are substituted when the template is compiled: they don't
+    depend on any scope value. Rendering the template for a scope value
+    only has to evaluate its ?{key} placeholders.
+    """
+    _string = None
+    _segments = None
+
+    def __init__(self, string, helpers):
+        self._string = string
+        expanded = expand_static(string, helpers)
+        # Odd indexes are the keys of the ?{key} placeholders.
+        self._segments = DYNAMIC_RE.split(expanded)
+
+    def __str__(self):
+        return self._string
+
+    def __repr__(self):
+        return "Template({!r})".format(self._string)
+
+    @property
+    def is_static(self):
+        """
+        True if the template has no ?{key} placeholder.
+        """
+        return len(self._segments) == 1
+
+    @property
+    def dynamic_keys(self):
+        return self._segments[1::2]
+
+    def render(self, resolve):
+        """
+        Return the string with every ?{key} replaced by 'resolve(key)'.
+        """
+        if self.is_static:
+            return self._segments[0]
+        segments = list(self._segments)
+        resolved = dict()
+        for i in range(1, len(segments), 2):
+            key = segments[i]
+            if key not in resolved:
+                resolved[key] = resolve(key)
+            segments[i] = resolved[key]
+        return "".join(segments)
@@ -49,6 +49,13 @@ def test_escape_reserved_re_char(init_logging):
         assert data_model.escape_reserved_re_char(char) == "\\" + char
 
 
+def test_unescape_reserved_re_char(init_logging):
+    string = "/a/b(c)[d].e^f$g\\h-i]x?"
+    escaped = data_model.escape_reserved_re_char(string)
+    assert data_model.unescape_reserved_re_char(escaped) == string
+    assert data_model.unescape_reserved_re_char("scope_1.*?/") is None
+
+
 def test_init(init_data_model):
     assert init_data_model._helpers ==\
         {'SCOPE_1': 'scope_1.*?/',
@@ -0,0 +1,364 @@
+import executor
+import scope_index
+import scope_tree
+import settings
+import pytest
+import path
+from scope import Scope
+from data_model import DataModel
+
+
+FILES = ["/r/s1/f", "/r/s1/g", "/r/s2/f", "/r/s2/g"]
+
+EXPRESSIONS = {'SUBJECT': '^/r/s\\d/',
+               'FILE': '^/r/s\\d/\\w'}
+
+
+class FakeNode():
+    def __init__(self, name, scope_name, parents, failing=(),
+                 expressions=EXPRESSIONS):
+        self.name = name
+        self.description = name
+        self.parents = parents
+        self.workers_modifier = 1
+        self.scope = Scope(scope_name, expressions[scope_name],
+                           DataModel.scope_index.values(scope_name))
+        self._failing = failing
+        self.outputs = {}
+
+    def cmd_for_value(self, scope_value):
+        if scope_value in self._failing:
+            return ["false"]
+        return ["true"] + self.args
+
+    def outputs_for_value(self, scope_value):
+        return self.outputs.get(scope_value, [])
+
+    args = []
+
+
+class FakePipeline():
+    def __init__(self, nodes):
+        self.nodes = {n.name: n for n in nodes}
+        self._nodes = nodes
+
+    def walk(self, node):
+        return self._nodes[self._nodes.index(node) + 1:]
+
+
+@pytest.fixture()
+def init_model(tmpdir):
+    settings.PRESTO_DIR = path.Path(str(tmpdir))
+    index = scope_index.ScopeIndex(EXPRESSIONS).build(FILES)
+    DataModel.scope_index = index
+    DataModel.scope_tree = scope_tree.ScopeTree(index)
+    yield
+    DataModel.scope_index = None
+    DataModel.scope_tree = None
+
+
+def disk_model(root):
+    """
+    Index the files under root, like a new execution of presto does.
+    """
+    from data_model import escape_reserved_re_char
+    expressions = {'SUBJECT': escape_reserved_re_char(str(root)) +
+                   '/s\\d/'}
+    files = sorted(str(f) for f in root.visit() if f.isfile())
+    index = scope_index.ScopeIndex(expressions).build(
+        files, escape=escape_reserved_re_char)
+    DataModel.scope_index = index
+    DataModel.scope_tree = scope_tree.ScopeTree(index)
+    return expressions
+
+
+def writing_node(root):
+    """
+    A node whose command writes out.txt next to its input files.
+    """
+    node = FakeNode("subjects", 'SUBJECT', [], expressions=disk_model(root))
+    node.cmd_for_value = lambda v: [
+        "sh", "-c", "date +%N > " + DataModel.literal_of(v) + "out.txt"]
+    return node
+
+
+def launched(node, fingerprinter):
+    """
+    Execute the node and return the scope values whose command has been
+    launched.
+    """
+    ex = executor.DagPipelineExecutor(FakePipeline([node]), 2)
+    ex.fingerprinter = fingerprinter
+    contexts = {}
+    record_status = ex._record_status
+
+    def record(n, v, s):
+        contexts[v] = s["context"]
+        record_status(n, v, s)
+    ex._record_status = record
+    ex.execute(node.name)
+    return sorted(v for v, c in contexts.items() if c == "EXECUTED")
+
+
+def test_outputs_written_next_to_inputs(init_model, tmpdir):
+    from fingerprint import Fingerprinter
+    settings.PRESTO_DIR = path.Path(str(tmpdir.mkdir(".presto")))
+    root = tmpdir.mkdir("data")
+    root.ensure("s1", "in.txt")
+    root.ensure("s2", "in.txt")
+    node = writing_node(root)
+    assert len(launched(node, Fingerprinter())) == 2
+    for _ in range(2):
+        # out.txt is now found by the walk of the next execution.
+        node = writing_node(root)
+        assert launched(node, Fingerprinter()) == []
+
+
+def test_declared_outputs_not_fingerprinted(init_model, tmpdir):
+    from fingerprint import Fingerprinter
+    settings.PRESTO_DIR = path.Path(str(tmpdir.mkdir(".presto")))
+    root = tmpdir.mkdir("data")
+    root.ensure("s1", "in.txt")
+    node = writing_node(root)
+    node.outputs = {v: [DataModel.literal_of(v) + "out.txt"]
+                    for v in node.scope.values}
+    assert len(launched(node, Fingerprinter('stat'))) == 1
+    for _ in range(2):
+        outputs = node.outputs
+        node = writing_node(root)
+        node.outputs = outputs
+        assert launched(node, Fingerprinter('stat')) == []
+    # a change of an input still launches the command.
+    root.join("s1", "in.txt").write("changed")
+    node = writing_node(root)
+    node.outputs = outputs
+    assert len(launched(node, Fingerprinter('stat'))) == 1
+
+
+def test_task_dependencies(init_model):
+    subjects = FakeNode("subjects", 'SUBJECT', [])
+    files = FakeNode("files", 'FILE', ["subjects"])
+    summary = FakeNode("summary", 'SUBJECT', ["files"])
+    ex = executor.DagPipelineExecutor(None, 2)
+    deps = ex._task_dependencies([subjects, files, summary])
+    assert deps[("subjects", "/r/s1/")] == set()
+    assert deps[("files", "/r/s1/f")] == {("subjects", "/r/s1/")}
+    assert deps[("summary", "/r/s2/")] == {("files", "/r/s2/f"),
+                                           ("files", "/r/s2/g")}
+
+
+def test_parent_failed(init_model):
+    subjects = FakeNode("subjects", 'SUBJECT', [], failing=["/r/s1/"])
+    files = FakeNode("files", 'FILE', ["subjects"])
+    ex = executor.DagPipelineExecutor(FakePipeline([subjects, files]), 2)
+    statuses = {}
+    ex._record_status = lambda node, v, s: statuses.setdefault(
+        node.name, {}).update({v: s})
+    ex.execute("subjects")
+    assert statuses["subjects"]["/r/s1/"]["status"] == "FAILURE"
+    assert statuses["subjects"]["/r/s2/"]["status"] == "SUCCESS"
+    assert statuses["files"]["/r/s1/f"]["context"] == "PARENT_FAILED"
+    assert statuses["files"]["/r/s2/g"]["context"] == "EXECUTED"
+
+
+def test_parallel_siblings(init_model):
+    subjects = FakeNode("subjects", 'SUBJECT', [])
+    files = FakeNode("files", 'FILE', ["subjects"])
+    other = FakeNode("other", 'SUBJECT', ["subjects"])
+    ex = executor.ParallelPipelineExecutor(None, 4)
+    deps = ex._task_dependencies([subjects, files, other])
+    assert deps[("subjects", None)] == {("subjects", "/r/s1/"),
+                                        ("subjects", "/r/s2/")}
+    assert deps[("files", "/r/s1/f")] == {("subjects", None)}
+    assert deps[("other", "/r/s2/")] == {("subjects", None)}
+
+
+def test_task_cost(init_model):
+    node = FakeNode("subjects", 'SUBJECT', [])
+    ex = executor.DagPipelineExecutor(None, 4)
+    assert ex._task_cost(node) == 1
+    node.workers_modifier = 0.5
+    assert ex._task_cost(node) == 2
+    node.workers_modifier = 0.1
+    assert ex._task_cost(node) == 4
+    node.workers_modifier = 2
+    assert ex._task_cost(node) == 1
+    ex = executor.DagPipelineExecutor(None, 8)
+    node.workers_modifier = 0.4
+    assert ex._task_cost(node) == 3
+    node.workers_modifier = 0.1
+    assert ex._task_cost(node) == 8
+    ex = executor.DagPipelineExecutor(None, 64)
+    node.workers_modifier = 1 / 49
+    assert ex._task_cost(node) == 49
+
+
+def test_async_executor(init_model):
+    subjects = FakeNode("subjects", 'SUBJECT', [], failing=["/r/s1/"])
+    ex = executor.AsyncPipelineExecutor(FakePipeline([subjects]), 2)
+    statuses = {}
+    ex._record_status = lambda node, v, s: statuses.setdefault(
+        node.name, {}).update({v: s})
+    ex.execute("subjects")
+    assert statuses["subjects"]["/r/s1/"]["context"] == "ERROR"
+    assert statuses["subjects"]["/r/s2/"]["context"] == "EXECUTED"
+
+
+def test_attempts_in_run_store(init_model, tmpdir):
+    from run_store import RunStore
+    subjects = FakeNode("subjects", 'SUBJECT', [], failing=["/r/s1/"])
+    ex = executor.DagPipelineExecutor(FakePipeline([subjects]), 2)
+    ex.run_store = RunStore(str(tmpdir.join("runs.sqlite")))
+    ex.execute("subjects")
+    subjects._failing = []
+    ex = executor.DagPipelineExecutor(FakePipeline([subjects]), 2)
+    ex.run_store = RunStore(str(tmpdir.join("runs.sqlite")))
+    ex.execute("subjects")
+    assert ex.run_store.failed(1) == [("subjects", "/r/s1/")]
+    assert ex.run_store.failed() == []
+    assert ex.run_store.summary() == {"subjects": {"SUCCESS": 2}}
+
+
+def test_run_without_store_not_ignored(init_model, tmpdir):
+    from run_store import RunStore
+    subjects = FakeNode("subjects", 'SUBJECT', [])
+
+    def execute(store, force=False):
+        ex = executor.DagPipelineExecutor(FakePipeline([subjects]), 2)
+        if store:
+            ex.run_store = RunStore(str(tmpdir.join("runs.sqlite")))
+        ex.force_execution = force
+        ex.execute("subjects")
+        if store:
+            ex.run_store.close()
+        return ex._journal(subjects).load()
+
+    execute(store=True)
+    subjects._failing = ["/r/s1/"]
+    statuses = execute(store=False, force=True)
+    assert statuses["/r/s1/"]["status"] == "FAILURE"
+    statuses = execute(store=True)
+    # the failure of the run without the store is retried.
+    assert statuses["/r/s1/"]["context"] == "ERROR"
+    assert statuses["/r/s2/"]["context"] == "NO_WORK_TO_DO"
+
+
+def test_fingerprint_propagation(init_model):
+    from fingerprint import Fingerprinter
+    subjects = FakeNode("subjects", 'SUBJECT', [])
+    files = FakeNode("files", 'FILE', ["subjects"])
+    pipeline = FakePipeline([subjects, files])
+
+    def execute():
+        ex = executor.DagPipelineExecutor(pipeline, 2)
+        ex.fingerprinter = Fingerprinter('stat')
+        statuses = {}
+        record_status = ex._record_status
+
+        def record(node, v, s):
+            statuses.setdefault(node.name, {})[v] = s["context"]
+            record_status(node, v, s)
+        ex._record_status = record
+        ex.execute("subjects")
+        return statuses
+
+    execute()
+    subjects.args = ["/r/s1/"]
+    statuses = execute()
+    assert statuses["subjects"] == {"/r/s1/": "EXECUTED",
+                                    "/r/s2/": "EXECUTED"}
+    assert set(statuses["files"].values()) == {"EXECUTED"}
+    statuses = execute()
+    assert set(statuses["files"].values()) == {"NO_WORK_TO_DO"}
+
+
+def test_up_to_date_outputs(init_model, tmpdir):
+    subjects = FakeNode("subjects", 'SUBJECT', [])
+    files = FakeNode("files", 'FILE', ["subjects"])
+    subjects.outputs = {"/r/s1/": [str(tmpdir.join("s1.out"))],
+                        "/r/s2/": [str(tmpdir.join("s2.out"))]}
+    files.outputs = {v: [str(tmpdir.join("files.out"))]
+                     for v in files.scope.values}
+    tmpdir.join("s1.out").write("")
+    tmpdir.join("files.out").write("")
+    ex = executor.DagPipelineExecutor(FakePipeline([subjects, files]), 2)
+    statuses = {}
+    record_status = ex._record_status
+
+    def record(node, v, s):
+        statuses.setdefault(node.name, {})[v] = s["context"]
+        record_status(node, v, s)
+    ex._record_status = record
+    ex.execute("subjects")
+    assert statuses["subjects"] == {"/r/s1/": "UP_TO_DATE",
+                                    "/r/s2/": "EXECUTED"}
+    assert statuses["files"]["/r/s1/f"] == "UP_TO_DATE"
+    assert statuses["files"]["/r/s2/f"] == "EXECUTED"
+
+
+def test_resources(init_model):
+    node = FakeNode("subjects", 'SUBJECT', [])
+    node.args = ["resources"]
+    ex = executor.ThreadedPipelineExecutor(None, 1)
+    status = ex._execute_one_scope_value(
+        node, "/r/s1/", ex._initial_scope_value_status({}, "/r/s1/"))
+    assert status["start_date"] <= status["end_date"]
+    assert status["user_time"] >= 0 and status["max_rss_kb"] > 0
+    summary = executor.resources_summary(
+        [status, {"context": "EXECUTED", "duration": 3.0},
+         {"context": "NO_WORK_TO_DO", "duration": 10.0}])
+    assert summary["wall_s"]["max"] == 3.0
+    assert summary["wall_s"]["p50"] == status["duration"]
+    assert summary["max_rss_kb"]["total"] == status["max_rss_kb"]
+
+
+def test_submission_order(init_model):
+    files = FakeNode("files", 'FILE', [])
+    ex = executor.ThreadedPipelineExecutor(None, 1)
+    assert ex._submission_order(files, {}) == files.scope.values
+    statuses = {"/r/s1/f": {"status": "FAILURE", "duration": 1.0},
+                "/r/s1/g": {"status": "SUCCESS", "duration": 9.0},
+                "/r/s2/g": {"status": "FAILURE", "duration": 5.0}}
+    # /r/s2/f has never been measured: the median duration (5.0).
+    assert ex._submission_order(files, statuses) == [
+        "/r/s2/f", "/r/s2/g", "/r/s1/f", "/r/s1/g"]
+
+
+def test_critical_path_priorities(init_model):
+    subjects = FakeNode("subjects", 'SUBJECT', [])
+    files = FakeNode("files", 'FILE', ["subjects"])
+    nodes = [subjects, files]
+    ex = executor.DagPipelineExecutor(None, 2)
+    dependencies = ex._task_dependencies(nodes)
+    dependents = dict()
+    for task, deps in dependencies.items():
+        for dep in deps:
+            dependents.setdefault(dep, []).append(task)
+    statuses = {"subjects": {}, "files": {}}
+    assert ex._critical_path_priorities(nodes, statuses, dependencies,
+                                        dependents) == {}
+    statuses = {"subjects": {"/r/s1/": {"duration": 1.0},
+                             "/r/s2/": {"duration": 2.0}},
+                "files": {"/r/s1/f": {"duration": 10.0},
+                          "/r/s2/f": {"duration": 3.0},
+                          "/r/s2/g": {"duration": 4.0}}}
+    priorities = ex._critical_path_priorities(nodes, statuses, dependencies,
+                                              dependents)
+    assert priorities[("files", "/r/s1/g")] == 4.0
+    # the short subject leads to the longest chain.
+    assert priorities[("subjects", "/r/s1/")] == 11.0
+    assert priorities[("subjects", "/r/s2/")] == 6.0
+
+
+def test_no_log_of_command_not_launched(init_model, tmpdir):
+    from output_log import log_filename
+    for executor_class in (executor.DagPipelineExecutor,
+                           executor.AsyncPipelineExecutor):
+        subjects = FakeNode("subjects", 'SUBJECT', [])
+        subjects.cmd_for_value = lambda v: ["/nonexistent/command"]
+        ex = executor_class(FakePipeline([subjects]), 2)
+        ex.force_execution = True
+        ex.execute("subjects")
+        statuses = ex._journal(subjects).load()
+        assert statuses["/r/s1/"]["context"] == "COMMAND_NOT_FOUND"
+        assert not log_filename("subjects", "/r/s1/").exists()
@@ -0,0 +1,84 @@
+import os
+import file_listing
+import pytest
+import path
+
+
+@pytest.fixture()
+def init_tree(tmpdir):
+    root = path.Path(str(tmpdir)).joinpath("root")
+    for d in ["a/b", "a/c", "d"]:
+        root.joinpath(d).makedirs_p()
+    # 'a/b-x' and 'a/b0' sort around the files of 'a/b/'
+    for f in ["a/b/1", "a/b/2", "a/b-x", "a/b0", "a/c/3", "d/4", "5"]:
+        root.joinpath(f).touch()
+    yield root, path.Path(str(tmpdir)).joinpath("cache").makedirs_p()
+
+
+def test_walk(init_tree):
+    root, _ = init_tree
+    files = file_listing.FileListing(root).walk()
+    assert files == sorted(root.walkfiles())
+
+
+def test_walk_threaded(init_tree):
+    root, cache = init_tree
+    files = file_listing.FileListing(root, cache, workers=4).walk()
+    assert files == sorted(root.walkfiles())
+
+
+def test_snapshot(init_tree, monkeypatch):
+    root, cache = init_tree
+    # Trust all mtimes, whatever the age of the tree.
+    monkeypatch.setattr(file_listing, "RACY_DELAY_NS", -10**18)
+    listing = file_listing.FileListing(root, cache)
+    listing.walk()
+    assert listing.snapshot_filename.exists()
+
+    scanned = []
+
+    def scan_directory(dirname):
+        scanned.append(dirname)
+        return real_scan_directory(dirname)
+
+    real_scan_directory = file_listing.scan_directory
+    monkeypatch.setattr(file_listing, "scan_directory", scan_directory)
+    assert listing.walk() == sorted(root.walkfiles())
+    assert scanned == []
+
+    root.joinpath("a/c/6").touch()
+    os.utime(root.joinpath("a/c"), ns=(0, 0))
+    assert listing.walk() == sorted(root.walkfiles())
+    assert scanned == [os.path.join(root, "a/c")]
+
+
+def test_stat_files(init_tree):
+    root, _ = init_tree
+    files = [root.joinpath("a", name) for name in ("b-x", "b0", "missing")]
+    files.append(root.joinpath("missing_dir", "1"))
+    mtimes = file_listing.stat_files(files)
+    assert mtimes[files[0]] == os.stat(files[0]).st_mtime_ns
+    assert mtimes[files[1]] is not None
+    assert mtimes[files[2]] is None
+    assert mtimes[files[3]] is None
+
+
+def test_presto_dir_not_walked(init_tree, monkeypatch):
+    import settings
+    root, _ = init_tree
+    # __ROOT__: ./ with the pipe file at the top of the data.
+    presto_dir = root.joinpath(".presto")
+    presto_dir.joinpath("logs", "node").makedirs_p()
+    presto_dir.joinpath("logs", "node", "a_b_1-0123.log").touch()
+    monkeypatch.setattr(settings, "PRESTO_DIR", presto_dir)
+    expected = sorted(f for f in root.walkfiles()
+                      if not f.startswith(presto_dir))
+    for workers in (1, 4):
+        listing = file_listing.FileListing(root, presto_dir, workers=workers)
+        assert listing.walk() == expected
+        # from the snapshot, now in presto_dir too.
+        presto_dir.joinpath("logs", "node", "a_b_2-4567.log").touch()
+        assert listing.walk() == expected
+    listing = file_listing.FileListing(root, presto_dir,
+                                       accept=lambda d: True)
+    assert listing.walk() == expected
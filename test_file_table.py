@@ -0,0 +1,32 @@
+import bisect
+import file_table
+import pytest
+import path
+
+
+FILES = sorted(["/r/a/b-x", "/r/a/b/1", "/r/a/b/2", "/r/a/b0", "/r/é/\udce9",
+                "/r/z"])
+
+
+@pytest.fixture()
+def init_table():
+    yield file_table.FileTable(FILES).freeze()
+
+
+def test_sequence(init_table):
+    assert len(init_table) == len(FILES)
+    assert list(init_table) == FILES
+    assert init_table == FILES
+    assert init_table[1] == FILES[1]
+    assert isinstance(init_table[1], path.Path)
+    assert init_table[-1] == FILES[-1]
+    assert init_table[1:3] == FILES[1:3]
+    with pytest.raises(IndexError):
+        init_table[len(FILES)]
+
+
+def test_bisect(init_table):
+    assert bisect.bisect_left(init_table, "/r/a/b/") == 1
+    assert init_table.index("/r/a/b0") == 3
+    assert init_table.index("/r/a/b") is None
+    assert "/r/z" in init_table
@@ -0,0 +1,33 @@
+import fingerprint
+import pytest
+
+
+@pytest.fixture()
+def init_files(tmpdir):
+    f = tmpdir.join("input")
+    f.write("content")
+    yield str(f)
+
+
+def test_stat(init_files):
+    fp = fingerprint.Fingerprinter('stat')
+    first = fp.fingerprint(["cmd", "a"], [init_files])
+    assert fp.fingerprint(["cmd", "a"], [init_files]) == first
+    assert fp.fingerprint(["cmd", "a", ""], [init_files]) != first
+    assert fp.fingerprint(["cmd", "a"], [init_files], ["up"]) != first
+    with open(init_files, 'a') as stream:
+        stream.write("more")
+    assert fp.fingerprint(["cmd", "a"], [init_files]) != first
+
+
+def test_content(init_files):
+    fp = fingerprint.Fingerprinter('content')
+    first = fp.fingerprint(["cmd"], [init_files])
+    fp = fingerprint.Fingerprinter('content')
+    with open(init_files, 'w') as stream:
+        stream.write("content")
+    assert fp.fingerprint(["cmd"], [init_files]) == first
+    assert fp.fingerprint(["cmd"], [init_files + "_missing"]) != first
+    assert fingerprint.Fingerprinter('none').fingerprint(["cmd"], []) == ""
+    with pytest.raises(fingerprint.FingerprintError):
+        fingerprint.Fingerprinter('md5')
@@ -0,0 +1,80 @@
+import journal
+import datetime
+import pytest
+import path
+from collections import OrderedDict
+from yaml_io import Literal
+
+
+def status(state, message):
+    s = OrderedDict()
+    s["execution_date"] = datetime.datetime(2016, 1, 2, 3, 4, 5)
+    s["status"] = state
+    s["context"] = "EXECUTED"
+    s["cmd"] = "cmd"
+    s["message"] = Literal(message)
+    return s
+
+
+@pytest.fixture()
+def init_journal(tmpdir):
+    yield journal.NodeJournal(path.Path(str(tmpdir)).joinpath("node.nexec"))
+
+
+def test_replay(init_journal):
+    init_journal.append("/a", status("FAILURE", "oops\n"))
+    init_journal.append("/b", status("SUCCESS", "ok\n"))
+    init_journal.append("/a", status("SUCCESS", "ok\n"))
+    with open(init_journal.journal_filename, 'a') as stream:
+        stream.write('["/c", {"status": "SUC')
+    reloaded = journal.NodeJournal(init_journal._snapshot_filename)
+    statuses = reloaded.load()
+    assert sorted(statuses) == ["/a", "/b"]
+    assert statuses["/a"] == status("SUCCESS", "ok\n")
+    assert isinstance(statuses["/a"]["message"], Literal)
+
+
+def test_append_after_truncated_record(init_journal):
+    init_journal.append("/a", status("SUCCESS", "ok\n"))
+    with open(init_journal.journal_filename, 'a') as stream:
+        stream.write('["/b", {"status": "SUC')
+    reloaded = journal.NodeJournal(init_journal._snapshot_filename)
+    reloaded.load()
+    reloaded.append("/c", status("SUCCESS", "ok\n"))
+    reloaded.append("/d", status("SUCCESS", "ok\n"))
+    statuses = journal.NodeJournal(init_journal._snapshot_filename).load()
+    assert sorted(statuses) == ["/a", "/c", "/d"]
+
+
+def test_corrupted_record(init_journal):
+    init_journal.append("/a", status("SUCCESS", "ok\n"))
+    with open(init_journal.journal_filename, 'a') as stream:
+        stream.write('["/b", {"status": "SUC\n')
+    init_journal.append("/c", status("SUCCESS", "ok\n"))
+    reloaded = journal.NodeJournal(init_journal._snapshot_filename)
+    with pytest.raises(journal.JournalError):
+        reloaded.load()
+
+
+def test_compact(init_journal, monkeypatch):
+    monkeypatch.setattr(journal, "COMPACT_MIN_RECORDS", 2)
+    init_journal.append("/a", status("SUCCESS", "ok\n"))
+    assert init_journal.journal_filename.exists()
+    init_journal.append("/b", status("SUCCESS", "ok\n"))
+    assert not init_journal.journal_filename.exists()
+    assert init_journal._snapshot_filename.exists()
+
+
+def test_background_compact(init_journal, monkeypatch):
+    from yaml_io import YamlIO
+    monkeypatch.setattr(journal, "COMPACT_MIN_RECORDS", 1)
+    YamlIO.start_writer(60)
+    try:
+        init_journal.append("/a", status("SUCCESS", "ok\n"))
+        init_journal.append("/b", status("SUCCESS", "ok\n"))
+        init_journal.close()
+    finally:
+        YamlIO.stop_writer()
+    assert init_journal._sealed() == []
+    assert not init_journal.journal_filename.exists()
+    assert init_journal._snapshot_filename.exists()
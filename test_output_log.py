@@ -0,0 +1,34 @@
+import output_log
+import settings
+import gzip
+import io
+import pytest
+import path
+
+
+@pytest.fixture()
+def init_settings(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, "PRESTO_DIR", path.Path(str(tmpdir)))
+    monkeypatch.setattr(settings, "OUTPUT_TAIL_SIZE", 8)
+    yield
+
+
+def test_log_filename(init_settings, monkeypatch):
+    f = output_log.log_filename("node", "/root/subj\\.1/")
+    assert f.parent == settings.PRESTO_DIR.joinpath("logs", "node")
+    assert f.name.startswith("root_subj_.1-")
+    assert f.ext == ".log"
+    monkeypatch.setattr(settings, "COMPRESS_LOGS", True)
+    assert output_log.log_filename("node", "/a").endswith(".log.gz")
+
+
+def test_tail(init_settings):
+    f = output_log.log_filename("node", "/a")
+    with output_log.OutputLog(f) as log:
+        log.write(b"first\n")
+    assert log.tail() == "first\n"
+    with output_log.OutputLog(f + ".gz") as log:
+        log.copy(io.BytesIO(b"line 1\nline 2\nline 3\n"), chunk_size=5)
+    assert log.size == 21
+    assert log.tail() == "[...]\nline 3\n"
+    assert gzip.open(f + ".gz").read() == b"line 1\nline 2\nline 3\n"
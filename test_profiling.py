@@ -0,0 +1,57 @@
+import time
+import pytest
+import profiling
+from profiling import Profiling
+from profiling import StackSampler
+
+
+@pytest.fixture()
+def clean_phases():
+    Profiling._PHASES.clear()
+    yield
+    Profiling.stop()
+    Profiling._PHASES.clear()
+
+
+def test_phase(clean_phases):
+    Profiling.start(trace_memory=True)
+    with Profiling.phase("allocate"):
+        data = bytearray(4 * 2**20)
+    for _ in range(2):
+        with Profiling.phase("repeated"):
+            pass
+    phases = Profiling.phases()
+    assert list(phases) == ["allocate", "repeated"]
+    assert phases["allocate"]["allocated_MB"] >= 4
+    assert phases["repeated"]["calls"] == 2
+    assert "allocate" in Profiling.summary()
+    del data
+
+
+def test_phase_without_memory(clean_phases):
+    with pytest.raises(ValueError):
+        with Profiling.phase("failing"):
+            raise ValueError()
+    phases = Profiling.phases()
+    assert phases["failing"]["calls"] == 1
+    assert phases["failing"]["peak_MB"] is None
+
+
+def test_without_resource(clean_phases, monkeypatch):
+    monkeypatch.setattr(profiling, "resource", None)
+    with Profiling.phase("no rss"):
+        pass
+    assert profiling.max_rss_mb() is None
+    assert "max RSS" not in Profiling.summary()
+
+
+def test_stack_sampler(tmpdir):
+    sampler = StackSampler(0.001)
+    time.sleep(0.05)
+    sampler.stop()
+    filename = str(tmpdir.join("stacks.txt"))
+    sampler.write(filename)
+    lines = open(filename).read().splitlines()
+    assert lines
+    assert all(line.startswith("MainThread;") for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
@@ -0,0 +1,82 @@
+import json
+import path
+import pytest
+import report
+import settings
+from collections import OrderedDict
+from journal import NodeJournal
+from run_store import RunStore
+from yaml_io import YamlIO
+from yaml_io import Literal
+
+
+def status(status, context, duration):
+    s = OrderedDict()
+    s["duration"] = duration
+    s["status"] = status
+    s["context"] = context
+    s["message"] = Literal("line 1\n\n  line 3\n")
+    return s
+
+
+@pytest.fixture()
+def presto_dir(tmpdir):
+    settings.PRESTO_DIR = path.Path(str(tmpdir))
+    return settings.PRESTO_DIR
+
+
+def test_scan_snapshot(presto_dir):
+    statuses = {"/r/s1/": status("SUCCESS", "EXECUTED", 1.5),
+                "/r/s2/": status("FAILURE", "PARENT_FAILED", ""),
+                "/r/s3/": status("FAILURE", "BAD FORMAT", 0.25)}
+    snapshot = presto_dir.joinpath("node" + settings.NODE_EXEC_SUFFIX)
+    YamlIO.dump_yaml(statuses, snapshot)
+    scanned = dict(report.scan_snapshot(snapshot))
+    assert scanned == {v: {"status": s["status"], "context": s["context"],
+                           "duration": s["duration"]}
+                       for v, s in statuses.items()}
+    # keys the scan doesn't understand: the document is parsed.
+    YamlIO.dump_yaml({"no": status("SUCCESS", "EXECUTED", 1)}, snapshot)
+    with pytest.raises(report.UnexpectedSyntax):
+        dict(report.scan_snapshot(snapshot))
+    assert report.node_statuses("node")["no"]["status"] == "SUCCESS"
+
+
+def test_build_report(presto_dir):
+    snapshot = presto_dir.joinpath("node" + settings.NODE_EXEC_SUFFIX)
+    YamlIO.dump_yaml({"/r/s1/": status("SUCCESS", "EXECUTED", 3.0),
+                      "/r/s2/": status("SUCCESS", "EXECUTED", 1.0),
+                      "/r/s3/": status("SUCCESS", "NO_WORK_TO_DO", 9.0)},
+                     snapshot)
+    journal = NodeJournal(snapshot)
+    journal.append("/r/s2/", status("FAILURE", "ERROR", 2.0))
+    journal.append("/r/s4/", status("FAILURE", "PARENT_FAILED", ""))
+    reports = report.build_report()
+    assert [r.name for r in reports] == ["node"]
+    assert reports[0].counts == dict(success=1, up_to_date=1, failure=1,
+                                     skipped=1)
+    d = json.loads(report.report_json(reports))
+    assert d["nodes"][0]["failed"] == ["/r/s2/"]
+    assert d["nodes"][0]["duration"]["max"] == 3.0
+    assert [t["scope_value"] for t in d["slowest"]] == ["/r/s1/", "/r/s2/"]
+    assert "/r/s2/" in report.report_table(reports)
+
+
+def test_report_of_run_without_store(presto_dir):
+    store = RunStore(str(presto_dir.joinpath("runs.sqlite")))
+    store.start_run("pipe.yaml")
+    journal = NodeJournal(NodeJournal.snapshot_filename_of("node"))
+    for scope_value in ("/r/s1/", "/r/s2/"):
+        journal.append(scope_value, status("SUCCESS", "EXECUTED", 1.0))
+        store.record("node", scope_value, status("SUCCESS", "EXECUTED", 1.0))
+    store.close()
+    # forced run without the store
+    journal.append("/r/s1/", status("FAILURE", "ERROR", 2.0))
+    journal.close()
+    statuses = NodeJournal(NodeJournal.snapshot_filename_of("node")).load()
+    assert {v: s["context"] for v, s in
+            report.node_statuses("node").items()} == \
+        {v: s["context"] for v, s in statuses.items()}
+    reports = report.build_report()
+    assert [r.name for r in reports] == ["node"]
+    assert reports[0].failed == ["/r/s1/"]
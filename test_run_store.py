@@ -0,0 +1,34 @@
+import run_store
+import datetime
+import pytest
+from collections import OrderedDict
+
+
+def status(state, duration=1.5):
+    s = OrderedDict()
+    s["execution_date"] = datetime.datetime(2016, 1, 2, 3, 4, 5)
+    s["duration"] = duration
+    s["status"] = state
+    s["context"] = "EXECUTED"
+    s["cmd"] = "cmd"
+    s["fingerprint"] = "abc"
+    s["log"] = "/logs/a.log"
+    s["output_size"] = 7
+    s["message"] = "output\n"
+    return s
+
+
+@pytest.fixture()
+def init_store(tmpdir):
+    store = run_store.RunStore(str(tmpdir.join("runs.sqlite")))
+    yield store
+    store.close()
+
+
+def test_queries(init_store):
+    run = init_store.start_run()
+    init_store.record("node", "/a", status("FAILURE"))
+    init_store.record("node", "/b", status("FAILURE"))
+    init_store.record("node", "/b", status("SUCCESS"))
+    assert init_store.failed() == [("node", "/a")]
+    assert init_store.summary(run) == {"node": {"FAILURE": 1, "SUCCESS": 1}}
@@ -0,0 +1,62 @@
+import re
+import scope_index
+import pytest
+
+
+FILES = ["/r/other/file",
+         "/r/scope_1_a/scope_2_1/scope_3-a_scope_4_x",
+         "/r/scope_1_a/scope_2_b/scope_3-b_scope_4_y",
+         "/r/scope_1_b/scope_2_1/scope_3-a_scope_4_x"]
+
+EXPRESSIONS = {'SCOPE_1': '^.*scope_1.*?/',
+               'SCOPE_2': 'scope_2_\\d/',
+               'SCOPE_3': 'scope_3-\\w'}
+
+
+@pytest.fixture()
+def init_index():
+    yield scope_index.ScopeIndex(EXPRESSIONS).build(FILES)
+
+
+def test_match_prefix():
+    for expression in EXPRESSIONS.values():
+        compiled = re.compile(expression)
+        for f in FILES + ["a\nb/scope_2_1/"]:
+            match = re.search(r".*?" + expression, f)
+            expected = match.group(0) if match else None
+            assert scope_index.match_prefix(compiled, f) == expected
+
+
+def test_top_level_alternation():
+    files = sorted(["/r/xxb_a", "/r/xxb", "/r/a_c", "/r/other"])
+    for expression in ["a|b", "_a|x(b|c)", "[|a]b|c", "(a|b)"]:
+        index = scope_index.ScopeIndex({'SCOPE': expression}).build(files)
+        expected = set()
+        for f in files:
+            match = re.search(r".*?" + expression, f)
+            if match:
+                expected.add(match.group(0))
+        assert sorted(index.values('SCOPE')) == sorted(expected)
+    assert not scope_index.has_top_level_alternation("(a|b)[|]\\|")
+
+
+def test_values(init_index):
+    assert init_index.values('SCOPE_1') == ["/r/scope_1_a/", "/r/scope_1_b/"]
+    assert init_index.values('SCOPE_2') == ["/r/scope_1_a/scope_2_1/",
+                                            "/r/scope_1_b/scope_2_1/"]
+    with pytest.raises(scope_index.ScopeIndexError):
+        init_index.values('SCOPE_5')
+
+
+def test_scope_values_of(init_index):
+    assert init_index.scope_values_of(FILES[2]) ==\
+        {'SCOPE_1': "/r/scope_1_a/",
+         'SCOPE_3': "/r/scope_1_a/scope_2_b/scope_3-b"}
+    assert init_index.scope_values_of(FILES[0]) == {}
+
+
+def test_files_of(init_index):
+    assert init_index.files_of("/r/scope_1_a/") == FILES[1:3]
+    assert init_index.files_of("/r/scope_1_b/scope_2_1/") == [FILES[3]]
+    assert init_index.files_of("") == FILES
+    assert init_index.files_of("/r/unknown/") is None
@@ -0,0 +1,39 @@
+import scope_index
+import scope_tree
+import pytest
+
+
+FILES = ["/r/other/file",
+         "/r/scope_1_a/scope_2_1/scope_3-a_scope_4_x",
+         "/r/scope_1_a/scope_2_b/scope_3-b_scope_4_y",
+         "/r/scope_1_b/scope_2_1/scope_3-a_scope_4_x"]
+
+EXPRESSIONS = {'SCOPE_1': '^.*scope_1.*?/',
+               'SCOPE_2': '^.*scope_2_.*?/',
+               'SCOPE_2_DIGIT': '^.*scope_2_\\d/',
+               'SCOPE_3': '^.*scope_3-\\w'}
+
+
+@pytest.fixture()
+def init_tree():
+    index = scope_index.ScopeIndex(EXPRESSIONS).build(FILES)
+    yield scope_tree.ScopeTree(index)
+
+
+def test_ancestor(init_tree):
+    value = "/r/scope_1_a/scope_2_1/scope_3-a"
+    assert init_tree.ancestor(value, 'SCOPE_1') == "/r/scope_1_a/"
+    assert init_tree.ancestor(value, 'SCOPE_2') == "/r/scope_1_a/scope_2_1/"
+    assert init_tree.ancestor(value, 'SCOPE_3') == value
+    assert init_tree.ancestor("/r/scope_1_a/", 'SCOPE_2') is None
+    assert init_tree.ancestor("/r/unknown", 'SCOPE_1') is None
+
+
+def test_parent_and_children(init_tree):
+    assert init_tree.roots() == ["/r/scope_1_a/", "/r/scope_1_b/"]
+    assert init_tree.parent("/r/scope_1_a/scope_2_1/") == "/r/scope_1_a/"
+    assert init_tree.children("/r/scope_1_a/") ==\
+        ["/r/scope_1_a/scope_2_1/", "/r/scope_1_a/scope_2_b/"]
+    assert init_tree.scopes_of("/r/scope_1_a/scope_2_1/") ==\
+        ['SCOPE_2', 'SCOPE_2_DIGIT']
+    assert [d for d, _ in init_tree.walk()] == [0, 1, 2, 1, 2, 0, 1, 2]
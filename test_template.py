@@ -0,0 +1,31 @@
+import template
+import pytest
+
+
+HELPERS = {'SCOPE_1': 'scope_1.*?/',
+           'SCOPE_2': '(${SCOPE_2_DIGIT}|${SCOPE_2_LETTER})',
+           'SCOPE_2_DIGIT': 'scope_2_\\d/',
+           'SCOPE_2_LETTER': 'scope_2_[a-zA-Z]/',
+           'SCOPE2_DYNAMIC': '?{SCOPE_2}',
+           'LOOP': '${LOOP}'}
+
+
+def test_expand_static():
+    assert template.expand_static('${SCOPE_1}', HELPERS) == 'scope_1.*?/'
+    assert template.expand_static('${SCOPE_2}', HELPERS) ==\
+        '(scope_2_\\d/|scope_2_[a-zA-Z]/)'
+    with pytest.raises(KeyError):
+        template.expand_static('${UNKNOWN}', HELPERS)
+    with pytest.raises(KeyError):
+        template.expand_static('${LOOP}', HELPERS)
+
+
+def test_template():
+    tmpl = template.Template('ls ${SCOPE2_DYNAMIC} ?{SCOPE_1->S}', HELPERS)
+    assert not tmpl.is_static
+    assert tmpl.dynamic_keys == ['SCOPE_2', 'SCOPE_1->S']
+    assert tmpl.render(lambda key: key.lower()) == 'ls scope_2 scope_1->s'
+
+    tmpl = template.Template('echo ${SCOPE_1}', HELPERS)
+    assert tmpl.is_static
+    assert tmpl.render(None) == 'echo scope_1.*?/'
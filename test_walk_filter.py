@@ -0,0 +1,48 @@
+import walk_filter
+import scope_index
+from file_listing import FileListing
+from data_model import escape_reserved_re_char
+
+
+def test_literal_prefixes():
+    assert walk_filter.literal_prefixes("scope_1/") is None
+    assert walk_filter.literal_prefixes("^.*scope_1.*?/") == {""}
+    assert walk_filter.literal_prefixes("^/r/s_(1|2)/x") == {"/r/s_1/x",
+                                                             "/r/s_2/x"}
+    assert walk_filter.literal_prefixes("^/r/(a|b\\d)") == {"/r/a", "/r/b"}
+    assert walk_filter.literal_prefixes("(?i)^/r/") == {""}
+
+
+def test_walk_filter():
+    accept = walk_filter.WalkFilter("/r", ["^/r/a/b", "^/r/c"])
+    assert accept.prunes
+    assert accept("/r")
+    assert accept("/r/a")
+    assert accept("/r/a/b")
+    assert accept("/r/a/b/d")
+    assert accept("/r/cd")
+    assert not accept("/r/a/c")
+    assert not accept("/r/d")
+
+    # An unanchored expression may match anywhere.
+    assert not walk_filter.WalkFilter("/r", ["^/r/a", "b/"]).prunes
+
+
+def test_walk_filter_relative():
+    accept = walk_filter.WalkFilter("/r", ["subj_042/"], relative=True)
+    assert accept("/r/subj_042")
+    assert not accept("/r/subj_041")
+    assert not accept("/r/subj_0421")
+
+
+def test_pruned_root_files(tmpdir):
+    tmpdir.ensure("subj_041", "in.txt")
+    tmpdir.ensure("subj_042", "in.txt")
+    root = escape_reserved_re_char(str(tmpdir))
+    accept = walk_filter.WalkFilter(str(tmpdir), ["subj_042/"],
+                                    relative=True)
+    files = list(FileListing(str(tmpdir), accept=accept).walk(False))
+    index = scope_index.ScopeIndex({'__ROOT__': root}).build(
+        files, escape=escape_reserved_re_char)
+    # the inputs of a node of scope __ROOT__ are the walked files only.
+    assert index.files_of(root) == [str(tmpdir.join("subj_042", "in.txt"))]
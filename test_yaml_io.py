@@ -0,0 +1,78 @@
+import os
+import yaml_io
+import settings
+import datetime
+import pytest
+from collections import OrderedDict
+from yaml_io import YamlIO, Literal
+
+
+@pytest.fixture()
+def init_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, "YAML_CACHE_DIR", str(tmpdir.join("cache")))
+    monkeypatch.setattr(YamlIO, "_DOCUMENTS_CACHE", dict())
+    yield tmpdir
+
+
+def test_load_all_cached(init_cache):
+    f = init_cache.join("pipe.yaml")
+    f.write("__NAME__: a\n---\n__NAME__: b\n")
+    docs = YamlIO.load_all_yaml(str(f))
+    assert docs == [{'__NAME__': 'a'}, {'__NAME__': 'b'}]
+    docs.pop(0)
+    assert len(YamlIO.load_all_yaml(str(f))) == 2
+    entries = [e.basename for e in init_cache.join("cache").listdir()]
+    assert entries == [os.path.basename(YamlIO.cache_filename(str(f)))]
+    # from the disk cache only
+    YamlIO._DOCUMENTS_CACHE.clear()
+    assert YamlIO.load_all_yaml(str(f))[1] == {'__NAME__': 'b'}
+    f.write("__NAME__: c\n")
+    assert YamlIO.load_all_yaml(str(f)) == [{'__NAME__': 'c'}]
+    # the entry of the file has been replaced
+    assert len(init_cache.join("cache").listdir()) == 1
+
+
+def test_cache_entry_of_other_content(init_cache):
+    f = init_cache.join("pipe.yaml")
+    f.write("__NAME__: a\n")
+    YamlIO.load_all_yaml(str(f))
+    YamlIO._DOCUMENTS_CACHE.clear()
+    entry = YamlIO.cache_filename(str(f))
+    with open(entry, 'rb') as stream:
+        header = stream.readline()
+    with open(entry, 'wb') as stream:
+        stream.write(header)
+        stream.write(b"not a pickle")
+    f.write("__NAME__: b\n")
+    assert YamlIO.load_all_yaml(str(f)) == [{'__NAME__': 'b'}]
+
+
+def test_dump_and_load(init_cache):
+    status = OrderedDict()
+    status["execution_date"] = datetime.datetime(2016, 1, 2, 3, 4, 5)
+    status["message"] = Literal("line 1\nline 2\n")
+    f = str(init_cache.join("node.nexec"))
+    YamlIO.dump_yaml({"/a": status}, f)
+    assert "message: |" in open(f).read()
+    assert YamlIO.load_yaml(f) == {"/a": dict(status)}
+    # no python tag the loader would refuse to read back.
+    with pytest.raises(yaml_io.yaml.representer.RepresenterError):
+        YamlIO.dump_yaml({"/a": object()}, f)
+    assert YamlIO.load_yaml(f) == {"/a": dict(status)}
+
+
+def test_background_writer(init_cache):
+    written = []
+    writer = yaml_io.BackgroundWriter(
+        lambda to_dump, f: written.append((f, to_dump)), 60)
+    writer.dump_later({"a": 1}, "f1")
+    writer.flush()
+    # the next writes of f1 have to wait for the interval: coalesced.
+    done = []
+    writer.dump_later({"a": 2}, "f1", lambda: done.append(2))
+    writer.dump_later({"a": 3}, "f1", lambda: done.append(3))
+    writer.dump_later({"b": 1}, "f2")
+    writer.stop()
+    assert written[0] == ("f1", {"a": 1})
+    assert sorted(written[1:]) == [("f1", {"a": 3}), ("f2", {"b": 1})]
+    assert done == [2, 3]
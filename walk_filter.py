@@ -0,0 +1,138 @@
+import os
+import logging
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+
+# Above this number of alternatives the analysis gives up.
+MAX_PREFIXES = 256
+
+
+def _literal_prefixes(parsed):
+    """
+    Return a list of (prefix, complete) covering all the strings matched by
+    the parsed sequence of regular expression items. 'complete' tells if the
+    prefix is the whole matched string, i.e. if something may follow it.
+    Return None when there are too many alternatives.
+    """
+    prefixes = [("", True)]
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            items = [(chr(av), True)]
+        elif (op is sre_constants.SUBPATTERN and
+              not av[1] & sre_constants.SRE_FLAG_IGNORECASE):
+            items = _literal_prefixes(av[-1])
+        elif (op is sre_constants.IN and
+              all(o is sre_constants.LITERAL for o, _ in av)):
+            # (1|2) is parsed as [12]
+            items = [(chr(a), True) for _, a in av]
+        elif op is sre_constants.BRANCH:
+            items = []
+            for branch in av[1]:
+                branch_items = _literal_prefixes(branch)
+                if branch_items is None:
+                    return None
+                items.extend(branch_items)
+        elif op is sre_constants.AT:
+            # '^' or '$' don't consume anything
+            continue
+        else:
+            items = [("", False)]
+        if items is None or len(prefixes) * len(items) > MAX_PREFIXES:
+            return None
+        next_prefixes = []
+        for prefix, complete in prefixes:
+            if not complete:
+                next_prefixes.append((prefix, False))
+                continue
+            for item, item_complete in items:
+                next_prefixes.append((prefix + item, item_complete))
+        prefixes = list(set(next_prefixes))
+        if not any(complete for _, complete in prefixes):
+            break
+    return prefixes
+
+
+def literal_prefixes(expression):
+    """
+    Return the set of literal strings one of which starts any match of the
+    given regular expression, when the expression is anchored at the
+    beginning of the string.
+    Return None if the expression is not anchored (it may match anywhere).
+    An empty string in the set means the expression may match anything.
+    """
+    parsed = sre_parse.parse(expression)
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return {""}
+    anchored = (len(parsed) > 0 and parsed[0][0] is sre_constants.AT and
+                parsed[0][1] in (sre_constants.AT_BEGINNING,
+                                 sre_constants.AT_BEGINNING_STRING))
+    if not anchored:
+        return None
+    prefixes = _literal_prefixes(parsed)
+    if prefixes is None:
+        return {""}
+    return {prefix for prefix, _ in prefixes}
+
+
+class WalkFilter():
+    """
+    Tell which directories under root may contain files matched by a set of
+    scope expressions, so the walk of root can skip the others.
+
+    Only expressions anchored at the beginning of the path and starting
+    with literal characters can rule out a directory. If 'relative' is set,
+    unanchored expressions are taken as anchored at root: 'subj_042/' only
+    keeps root/subj_042/ (this is what --prune does).
+    """
+    _root = None
+    _prefixes = None
+
+    def __init__(self, root, expressions, relative=False):
+        self._root = os.path.join(root, "")
+        prefixes = set()
+        for expression in expressions:
+            prefixes.update(self._expression_prefixes(expression, relative))
+        if "" in prefixes or not prefixes:
+            self._prefixes = None
+        else:
+            self._prefixes = tuple(sorted(prefixes))
+        logging.debug("walk filter prefixes: %s", self._prefixes)
+
+    def _expression_prefixes(self, expression, relative):
+        try:
+            expr_prefixes = literal_prefixes(expression)
+            if expr_prefixes is None and relative:
+                anchored = "^(?:" + expression + ")"
+                expr_prefixes = {self._root + p for p
+                                 in literal_prefixes(anchored)}
+        except sre_constants.error:
+            # bad expressions are reported when building the scopes.
+            expr_prefixes = None
+        if expr_prefixes is None:
+            return {""}
+        return expr_prefixes
+
+    @property
+    def prunes(self):
+        """
+        False if every directory is accepted.
+        """
+        return self._prefixes is not None
+
+    def __call__(self, dirname):
+        """
+        True if files under 'dirname' may be matched by an expression.
+        """
+        if self._prefixes is None:
+            return True
+        dirname = os.path.join(dirname, "")
+        for prefix in self._prefixes:
+            if prefix.startswith(dirname) or dirname.startswith(prefix):
+                return True
+        return False
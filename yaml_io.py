@@ -1,12 +1,45 @@
 from concurrent.futures.thread import threading
+import os
+import time
+import pickle
+import hashlib
 import logging
 import yaml
 from collections import OrderedDict
+import settings
+from profiling import Profiling
+
+# Use libyaml when PyYAML has been built with it, it is about four times
+# faster than the pure python implementation. Both are safe: what is
+# dumped can always be loaded back.
+try:
+    Loader = yaml.CSafeLoader
+    Dumper = yaml.CSafeDumper
+except AttributeError:
+    Loader = yaml.SafeLoader
+    Dumper = yaml.SafeDumper
 
 
 class YamlIO():
 
+    # Protects _LOCKS, each file has its own lock.
     _LOCK = threading.Lock()
+    _LOCKS = dict()
+    # Parsed documents, pickled, keyed by documents_key.
+    _DOCUMENTS_CACHE = dict()
+    # Optional BackgroundWriter, see start_writer.
+    _WRITER = None
+
+    @classmethod
+    def _lock_of(cls, yaml_filename):
+        key = os.path.abspath(yaml_filename)
+        with cls._LOCK:
+            try:
+                return cls._LOCKS[key]
+            except KeyError:
+                lock = threading.Lock()
+                cls._LOCKS[key] = lock
+                return lock
 
     @classmethod
     def load_yaml(cls, yaml_filename):
@@ -14,13 +47,14 @@ class YamlIO():
         Load a single yaml document from a file in a thread safe context.
         """
         try:
-            with cls._LOCK:
-                yaml_doc = yaml.load(open(yaml_filename, 'r'))
+            with cls._lock_of(yaml_filename):
+                with open(yaml_filename, 'r') as stream:
+                    yaml_doc = yaml.load(stream, Loader=Loader)
         except OSError:
             logging.critical("Unable to open file %s:", yaml_filename)
             raise
         except (yaml.YAMLError, yaml.scanner.ScannerError):
-            logging.critical("Error while parsing file %S:", yaml_filename)
+            logging.critical("Error while parsing file %s:", yaml_filename)
             raise
         return yaml_doc
 
@@ -28,38 +62,248 @@ class YamlIO():
     def load_all_yaml(cls, yaml_filename):
         """
         Load a list of yaml documents from a file in a thread safe context.
+
+        Parsed documents are cached by content (on disk in
+        settings.YAML_CACHE_DIR if set, one entry per file replaced when it
+        changes), so a pipeline file or an included file is only parsed
+        again when it changes.
         """
         try:
-            with cls._LOCK:
-                yaml_docs = yaml.load_all(open(yaml_filename, 'r'))
-            # stream.close()
+            with open(yaml_filename, 'rb') as stream:
+                content = stream.read()
+                source_stat = os.fstat(stream.fileno())
         except OSError:
             logging.critical("Unable to open file %s:", yaml_filename)
             raise
-        except (yaml.YAMLError, yaml.scanner.ScannerError):
-            logging.critical("Error while parsing file %s:", yaml_filename)
-            raise
-        return list(yaml_docs)
+        key = cls.documents_key(content)
+        header = "{0} {1} {2}\n".format(key, source_stat.st_size,
+                                        source_stat.st_mtime_ns).encode()
+        data = cls._cached_documents(yaml_filename, key, header)
+        if data is None:
+            try:
+                yaml_docs = list(yaml.load_all(content, Loader=Loader))
+            except (yaml.YAMLError, yaml.scanner.ScannerError):
+                logging.critical("Error while parsing file %s:",
+                                 yaml_filename)
+                raise
+            data = pickle.dumps(yaml_docs, pickle.HIGHEST_PROTOCOL)
+            cls._cache_documents(yaml_filename, key, header, data)
+        # Unpickle each time, callers get documents they can modify.
+        return pickle.loads(data)
+
+    @staticmethod
+    def documents_key(content):
+        """
+        Key of the parsed documents of a file content in the cache.
+        """
+        h = hashlib.sha1(content)
+        h.update(Loader.__name__.encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def cache_filename(yaml_filename):
+        """
+        The entry of a file in settings.YAML_CACHE_DIR: its documents
+        pickled, after a header line with their key and the size and
+        modification date of the file they have been parsed from.
+        """
+        name = hashlib.sha1(os.fsencode(os.path.abspath(yaml_filename)))
+        return os.path.join(settings.YAML_CACHE_DIR,
+                            name.hexdigest() + ".pickle")
+
+    @classmethod
+    def _cached_documents(cls, yaml_filename, key, header):
+        try:
+            return cls._DOCUMENTS_CACHE[key]
+        except KeyError:
+            pass
+        if not settings.YAML_CACHE_DIR:
+            return None
+        try:
+            with open(cls.cache_filename(yaml_filename), 'rb') as stream:
+                # nothing is unpickled from an entry of another content.
+                if stream.readline() != header:
+                    return None
+                data = stream.read()
+        except OSError:
+            return None
+        cls._DOCUMENTS_CACHE[key] = data
+        return data
+
+    @classmethod
+    def _cache_documents(cls, yaml_filename, key, header, data):
+        cls._DOCUMENTS_CACHE[key] = data
+        if not settings.YAML_CACHE_DIR:
+            return
+        filename = cls.cache_filename(yaml_filename)
+        try:
+            os.makedirs(settings.YAML_CACHE_DIR, exist_ok=True)
+            with open(filename + ".tmp", 'wb') as stream:
+                stream.write(header)
+                stream.write(data)
+            os.replace(filename + ".tmp", filename)
+        except OSError:
+            logging.warning("Unable to cache parsed documents in %s",
+                            filename)
 
     @classmethod
     def dump_yaml(cls, to_dump, yaml_filename):
         """
         Dump a python object inside a yaml document in a thread safe context
+
+        The document is written in a temporary file which replaces the file
+        once synced, a reader never sees a partial document.
         """
+        tmp_filename = yaml_filename + ".tmp"
         try:
-            with cls._LOCK:
-                yaml.dump(to_dump, open(yaml_filename, 'w'),
-                          default_flow_style=False,
-                          allow_unicode=True)
+            with cls._lock_of(yaml_filename), Profiling.phase("yaml dumps"):
+                with open(tmp_filename, 'w') as stream:
+                    yaml.dump(to_dump, stream,
+                              Dumper=Dumper,
+                              default_flow_style=False,
+                              allow_unicode=True)
+                    stream.flush()
+                    os.fsync(stream.fileno())
+                os.replace(tmp_filename, yaml_filename)
         except OSError:
             logging.critical("Unable to open file %s:", yaml_filename)
             raise
-        except (yaml.critical.YAMLError):
+        except yaml.YAMLError:
             logging.critical("Unable to dump %s in %s:\n",
                              to_dump,
                              yaml_filename)
             raise
 
+    @classmethod
+    def dump_yaml_later(cls, to_dump, yaml_filename, callback=None):
+        """
+        Dump like dump_yaml, by the background writer if it is started
+        (right now otherwise). 'to_dump' must not be modified afterwards.
+        'callback' is called once the document has been written.
+        """
+        if cls._WRITER is None:
+            cls.dump_yaml(to_dump, yaml_filename)
+            if callback is not None:
+                callback()
+        else:
+            cls._WRITER.dump_later(to_dump, yaml_filename, callback)
+
+    @classmethod
+    def start_writer(cls, interval):
+        """
+        Write the documents of dump_yaml_later from a background thread, at
+        most once per file every 'interval' seconds.
+        """
+        if cls._WRITER is None:
+            cls._WRITER = BackgroundWriter(cls.dump_yaml, interval)
+
+    @classmethod
+    def flush(cls):
+        """
+        Wait for all the documents given to dump_yaml_later to be written.
+        """
+        if cls._WRITER is not None:
+            cls._WRITER.flush()
+
+    @classmethod
+    def stop_writer(cls):
+        if cls._WRITER is not None:
+            cls._WRITER.stop()
+            cls._WRITER = None
+
+
+class BackgroundWriter():
+    """
+    A thread writing documents given with dump_later.
+
+    Documents given for a file while its previous one is still waiting
+    replace it: a burst of updates of a file is coalesced in one write, and
+    a file is written at most once per 'interval' seconds.
+    """
+    _dump = None
+    _interval = 0
+    _pending = None
+    _last_write = None
+    _writing = 0
+    _stopped = False
+    _condition = None
+    _thread = None
+
+    def __init__(self, dump, interval):
+        self._dump = dump
+        self._interval = interval
+        self._pending = OrderedDict()
+        self._last_write = dict()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run,
+                                        name="yaml-writer", daemon=True)
+        self._thread.start()
+
+    def dump_later(self, to_dump, filename, callback=None):
+        with self._condition:
+            callbacks = []
+            if filename in self._pending:
+                callbacks = self._pending[filename][1]
+            if callback is not None:
+                callbacks.append(callback)
+            self._pending[filename] = (to_dump, callbacks)
+            self._condition.notify_all()
+
+    def flush(self):
+        """
+        Write now what is pending and wait for it.
+        """
+        with self._condition:
+            self._last_write.clear()
+            self._condition.notify_all()
+            while self._pending or self._writing:
+                self._condition.wait()
+
+    def stop(self):
+        self.flush()
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _next(self):
+        """
+        Wait for a pending file allowed to be written, None once stopped.
+        """
+        with self._condition:
+            while True:
+                if self._stopped and not self._pending:
+                    return None
+                now = time.monotonic()
+                wait = None
+                for filename in self._pending:
+                    ready = self._last_write.get(filename, 0) + self._interval
+                    if ready <= now:
+                        to_dump, callbacks = self._pending.pop(filename)
+                        self._last_write[filename] = now
+                        self._writing += 1
+                        return filename, to_dump, callbacks
+                    if wait is None or ready - now < wait:
+                        wait = ready - now
+                self._condition.wait(wait)
+
+    def _run(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            filename, to_dump, callbacks = task
+            try:
+                self._dump(to_dump, filename)
+                for callback in callbacks:
+                    callback()
+            except Exception:
+                logging.exception("Background write of %s failed", filename)
+            finally:
+                with self._condition:
+                    self._writing -= 1
+                    self._condition.notify_all()
+
 
 # To be able to dump some string as litteral and OrderedDict as regular Dict
 class Literal(str):
@@ -72,12 +316,15 @@ class Literal(str):
 
 
 def literal_presenter(dumper, data):
-    return dumper.represent_scalar(u'tag:yaml.org,2002:str', data, style='|')
+    # libyaml's emitter only accepts exact str instances.
+    return dumper.represent_scalar(u'tag:yaml.org,2002:str', str(data),
+                                   style='|')
 
 
 def ordered_dict_presenter(dumper, data):
     return dumper.represent_dict(data.items())
 
 
-yaml.add_representer(Literal, literal_presenter)
-yaml.add_representer(OrderedDict, ordered_dict_presenter)
+for dumper in {yaml.SafeDumper, Dumper}:
+    yaml.add_representer(Literal, literal_presenter, Dumper=dumper)
+    yaml.add_representer(OrderedDict, ordered_dict_presenter, Dumper=dumper)